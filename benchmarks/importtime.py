@@ -0,0 +1,85 @@
+"""
+Misst, wie lange der Import der fimo Module in einem frischen Interpreter dauert,
+und vergleicht das mit dem Startbudget.
+
+    python benchmarks/importtime.py [--repeat N]
+
+Gibt die Messwerte als JSON aus und endet mit Exit Code 1, wenn ein Modul sein
+Budget überschreitet oder beim Import Module lädt, die es nicht braucht.
+"""
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+import click
+
+# Budget in ms (bester von mehreren Läufen)
+BUDGET_MS = {
+    "fimo.importer": 80,
+    "fimo.cli": 120,
+    "fimo.monitor": 150,
+}
+
+# Module, die beim Import noch nicht geladen sein dürfen
+FORBIDDEN = {
+    "fimo.importer": ["numpy", "matplotlib", "concurrent.futures.process"],
+    "fimo.cli": ["numpy", "matplotlib"],
+    "fimo.monitor": ["matplotlib", "dateutil"],
+}
+
+_MEASURE = """
+import sys, time
+t = time.perf_counter()
+import {module}
+t = time.perf_counter() - t
+print(t * 1000)
+print(",".join(m for m in {forbidden!r} if m in sys.modules))
+"""
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def measure(module: str, repeat: int):
+    times = []
+    loaded = set()
+    for _ in range(repeat):
+        out = subprocess.run(
+            [
+                sys.executable,
+                "-c",
+                _MEASURE.format(module=module, forbidden=FORBIDDEN[module]),
+            ],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.splitlines()
+        times.append(float(out[0]))
+        loaded.update(m for m in out[1].split(",") if m)
+
+    return min(times), sorted(loaded)
+
+
+@click.command()
+@click.option("--repeat", default=5, type=click.IntRange(min=1))
+def main(repeat):
+    results = {}
+    ok = True
+    for module, budget in BUDGET_MS.items():
+        ms, loaded = measure(module, repeat)
+        within = ms <= budget and not loaded
+        ok = ok and within
+        results[module] = {
+            "ms": round(ms, 1),
+            "budget_ms": budget,
+            "unexpected_modules": loaded,
+            "ok": within,
+        }
+
+    print(json.dumps(results, indent=2))
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
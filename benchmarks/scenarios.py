@@ -0,0 +1,314 @@
+"""
+Misst Import und Abfragen auf synthetischen Kontoauszügen (siehe statements.py).
+
+    python benchmarks/scenarios.py [--rows N] [--files N] [--regex-rules N]
+                                   [--repeat N] [--only NAME] [--compare OLD.json]
+
+Jedes Szenario wird repeat Mal ausgeführt, vorbereitende Schritte (Import,
+Aufbau des Monitors) zählen nicht mit. Die Ergebnisse gehen als JSON auf stdout,
+so lassen sich die Läufe zweier Versionen vergleichen. Mit --compare wird zu
+jedem Szenario das Verhältnis zur alten Messung ausgegeben.
+
+Ein Szenario, das in der gemessenen Version fehlschlägt, erscheint mit seinem
+Fehler statt mit Zeiten, die übrigen laufen weiter.
+"""
+import csv
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import click
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT.joinpath("benchmarks")))
+
+import statements  # noqa: E402
+
+from fimo import importer, monitor  # noqa: E402
+from fimo.monitor import RecordQuery  # noqa: E402
+
+
+def _queries(startdate: date, enddate: date, expenses: bool = False):
+    """Abfragen für Listen und Plots, mit expenses nur Ausgaben (positiv)."""
+    queries = [
+        dict(labels=["Lebensmittel"], plotlabel="Lebensmittel"),
+        dict(labels=["Miete", "Strom"], plotlabel="Wohnen"),
+        dict(labels=["Auto", "Reisen"], spender="Martin", plotlabel="Mobil"),
+        dict(labels=["Online"], spender="Liane", plotlabel="Online"),
+    ]
+    if not expenses:
+        queries.append(dict(labels=["Einkommen"], plotlabel="Einkommen"))
+
+    return [
+        RecordQuery(startdate=startdate, enddate=enddate, invert=expenses, **q)
+        for q in queries
+    ]
+
+
+class Scenarios:
+    """
+    Die Szenarien auf einem Datensatz. Jede Methode run_* bereitet vor und gibt
+    die zu messende Funktion zurück.
+    """
+
+    def __init__(
+        self,
+        accounts: List[importer.Account],
+        outdir: Path,
+        startdate: date,
+        enddate: date,
+    ):
+        self._accounts = accounts
+        self._outdir = outdir
+        self._startdate = startdate
+        self._enddate = enddate
+        self._monitor: Optional[monitor.Monitor] = None
+
+    @property
+    def monitor(self) -> monitor.Monitor:
+        # ohne Ergebniscache, sonst misst jede Wiederholung nur den Cache
+        if self._monitor is None:
+            self._monitor = monitor.Monitor(self._accounts, query_cache_size=0)
+
+        return self._monitor
+
+    def run_import_nocache(self) -> Callable:
+        def run():
+            for account in self._accounts:
+                importer.AccountImporter(account, use_cache=False).do_import()
+
+        return run
+
+    def run_import_cached(self) -> Callable:
+        importer.import_accounts(self._accounts)
+
+        def run():
+            for account in self._accounts:
+                importer.AccountImporter(account).do_import()
+
+        return run
+
+    def _rule_rows(self):
+        account = next(a for a in self._accounts if not a.labelled)
+        rulespath = account.srcpath.joinpath(
+            importer.RULES_SUBDIR, importer.REGEX_RULE_FILENAME
+        )
+        with importer.CSVReader(rulespath, delimiter=";") as reader:
+            rules = list(reader)
+
+        rows = []
+        for filepath in sorted(account.srcpath.glob("*.csv")):
+            with open(filepath) as f:
+                lines, _ = importer._lines_from_header(f)
+                rows.extend(csv.DictReader(lines, delimiter=";"))
+
+        return rules, rows, rulespath
+
+    def run_apply_rules(self) -> Callable:
+        # _apply_rules kompiliert je Aufruf, daher nur ein Ausschnitt der Zeilen
+        rules, rows, rulespath = self._rule_rows()
+        rows = rows[:200]
+
+        def run():
+            for row in rows:
+                r = dict(
+                    row, **{importer.LABEL_HEADING: "", importer.COMMENT_HEADING: ""}
+                )
+                importer._apply_rules(r, rules, True, True, rulespath)
+
+        return run
+
+    def run_rule_engine(self) -> Callable:
+        rules, rows, rulespath = self._rule_rows()
+
+        def run():
+            engine = importer.RuleEngine(rules, True, rulespath)
+            for row in rows:
+                r = dict(
+                    row, **{importer.LABEL_HEADING: "", importer.COMMENT_HEADING: ""}
+                )
+                engine.apply(r, True)
+
+        return run
+
+    def run_monitor_load(self) -> Callable:
+        importer.import_accounts(self._accounts)
+
+        def run():
+            monitor.Monitor(self._accounts)
+
+        return run
+
+    def run_catlist(self) -> Callable:
+        m = self.monitor
+
+        def run():
+            for q in _queries(self._startdate, self._enddate):
+                m.catlist(
+                    labels=q.labels,
+                    spender=q.spender,
+                    startdate=q.startdate,
+                    enddate=q.enddate,
+                )
+
+        return run
+
+    def run_monthlycatsumplotdata(self) -> Callable:
+        m = self.monitor
+
+        def run():
+            for q in _queries(self._startdate, self._enddate):
+                m.monthlycatsumplotdata(
+                    q.labels, q.spender, q.startdate, q.enddate, invert=q.invert
+                )
+
+        return run
+
+    def run_compensation(self) -> Callable:
+        m = self.monitor
+
+        def run():
+            for year in range(self._startdate.year, self._enddate.year):
+                m.compensation(
+                    "Martin",
+                    ["Lebensmittel", "Miete", "Strom", "Gesundheit"],
+                    ["Transfer"],
+                    date(year, 1, 1),
+                    date(year + 1, 1, 1),
+                )
+
+        return run
+
+    def _plot(self, method: str, expenses: bool = False) -> Callable:
+        m = self.monitor
+        queries = _queries(self._startdate, self._enddate, expenses)
+        filename = str(self._outdir.joinpath(f"{method}.png"))
+
+        def run():
+            getattr(m, method)(queries, filename)
+
+        return run
+
+    def run_org_monthlycatsumplot(self) -> Callable:
+        return self._plot("org_monthlycatsumplot")
+
+    def run_org_catsumsplot(self) -> Callable:
+        return self._plot("org_catsumsplot", expenses=True)
+
+    def run_org_catsumplot(self) -> Callable:
+        return self._plot("org_catsumplot")
+
+    def run_org_catplot(self) -> Callable:
+        return self._plot("org_catplot")
+
+
+SCENARIOS = [name[len("run_") :] for name in vars(Scenarios) if name.startswith("run_")]
+
+
+def measure(run: Callable, repeat: int) -> Dict:
+    times = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - t)
+
+    return {
+        "min_s": round(min(times), 4),
+        "median_s": round(statistics.median(times), 4),
+        "runs": repeat,
+    }
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+@click.command()
+@click.option(
+    "--files", default=3, type=click.IntRange(min=1), help="Statements per account"
+)
+@click.option(
+    "--rows", default=2000, type=click.IntRange(min=1), help="Rows per statement"
+)
+@click.option("--regex-rules", default=50, type=click.IntRange(min=0))
+@click.option("--repeat", default=3, type=click.IntRange(min=1))
+@click.option("--seed", default=1)
+@click.option(
+    "--only",
+    multiple=True,
+    type=click.Choice(SCENARIOS),
+    help="Run only these scenarios (repeatable)",
+)
+@click.option(
+    "--compare",
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+    help="Results of an earlier run to compare with",
+)
+def main(files, rows, regex_rules, repeat, seed, only, compare):
+    previous = json.loads(compare.read_text())["scenarios"] if compare else {}
+
+    with tempfile.TemporaryDirectory(prefix="fimo-bench-") as tmp:
+        tmp = Path(tmp)
+        accounts = [
+            importer.Account.parse_obj(a)
+            for a in statements.generate(
+                tmp.joinpath("data"), files, rows, regex_rules, seed=seed
+            )
+        ]
+        # einmal importieren, damit die Regeldateien wie im Alltag schon existieren
+        importer.import_accounts(accounts, use_cache=False)
+        outdir = tmp.joinpath("plots")
+        outdir.mkdir()
+
+        scenarios = Scenarios(
+            accounts,
+            outdir,
+            date(statements.START_YEAR, 1, 1),
+            date(statements.START_YEAR + files, 1, 1),
+        )
+        results = {}
+        for name in only if only else SCENARIOS:
+            try:
+                result = measure(getattr(scenarios, f"run_{name}")(), repeat)
+            except Exception as e:
+                result = {"error": f"{type(e).__name__}: {e}"}
+
+            if "min_s" in result and "min_s" in previous.get(name, {}):
+                result["ratio"] = round(result["min_s"] / previous[name]["min_s"], 3)
+            results[name] = result
+            print(f"{name}: {result}", file=sys.stderr)
+
+    print(
+        json.dumps(
+            {
+                "revision": _git_revision(),
+                "python": platform.python_version(),
+                "params": dict(
+                    files=files, rows=rows, regex_rules=regex_rules, seed=seed
+                ),
+                "scenarios": results,
+            },
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
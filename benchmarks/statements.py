@@ -0,0 +1,339 @@
+"""
+Erzeugt synthetische Kontoauszüge und Regeldateien für die Benchmarks.
+
+    python benchmarks/statements.py OUTDIR [--files N] [--rows N] [--regex-rules N]
+
+Die Auszüge sehen aus wie die Exporte der Banken: deutsche Datums- und
+Betragsformate, Vorspann vor der Kopfzeile, Semikolon als Trennzeichen. Neben
+den Konten wird eine config.yml geschrieben, die fimo-import direkt lesen kann.
+Mit gleichem seed entstehen dieselben Dateien.
+"""
+import csv
+import datetime
+import random
+import shutil
+import sys
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional
+
+import click
+import yaml
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fimo.importer import COMMENT_HEADING, LABEL_HEADING  # noqa: E402
+from fimo.monitor import prefix_label  # noqa: E402
+
+HEADINGS = [
+    "Buchungstag",
+    "Valuta",
+    "Auftraggeber / Begünstigter",
+    "Zahler",
+    "Verwendungszweck",
+    "Betrag (EUR)",
+]
+
+PREAMBLE = [
+    ["Kontoauszug", ""],
+    ["Kontonummer:", "DE12 3456 7890 1234 5678 90"],
+    ["Zeitraum:", "01.01.{year} - 31.12.{year}"],
+    ["Kontostand vom 31.12.{year}:", "1.234,56 EUR"],
+    [""],
+]
+
+START_YEAR = 2015
+SPENDERS = ["Martin", "Liane"]
+
+
+class Counterparty(NamedTuple):
+    receiver: str
+    purpose: str
+    label: str
+    cents_min: int
+    cents_max: int
+
+
+COUNTERPARTIES = [
+    Counterparty(
+        "REWE Markt GmbH",
+        "Lastschrift {n} REWE SAGT DANKE",
+        "Lebensmittel",
+        -12000,
+        -500,
+    ),
+    Counterparty(
+        "EDEKA Center", "Kartenzahlung {n} EDEKA", "Lebensmittel", -9000, -300
+    ),
+    Counterparty("dm-drogerie markt", "Kartenzahlung {n}", "Drogerie", -4000, -200),
+    Counterparty("Stadtwerke", "Abschlag Strom Kd-Nr {n}", "Strom", -11000, -6000),
+    Counterparty("Vermieter GmbH", "Miete Wohnung {n}", "Miete", -110000, -90000),
+    Counterparty("Amazon EU S.a.r.l.", "{n} Amazon.de", "Online", -15000, -800),
+    Counterparty("DB Vertrieb GmbH", "Fahrkarte {n}", "Reisen", -25000, -1500),
+    Counterparty("Apotheke am Markt", "Kartenzahlung {n}", "Gesundheit", -6000, -300),
+    Counterparty("Aral Tankstelle", "Tanken {n}", "Auto", -9000, -2000),
+    Counterparty("Arbeitgeber AG", "Lohn/Gehalt {n}", "Einkommen", 250000, 400000),
+    Counterparty("Kita Sonnenschein", "Beitrag {n}", "Kinder", -30000, -20000),
+    Counterparty("Versicherung AG", "Beitrag Police {n}", "Versicherung", -8000, -2000),
+]
+TRANSFER = Counterparty("{other}", "Umbuchung {n}", "Transfer", -50000, -10000)
+
+
+def german_amount(cents: int, rng: random.Random) -> str:
+    """Betrag wie in den Exporten, mit Tausenderpunkt und gelegentlich gekürzt."""
+    text = f"{abs(cents) / 100:,.2f}".replace(",", "X").replace(".", ",")
+    text = text.replace("X", ".")
+    if rng.random() < 0.1 and text.endswith("0"):
+        text = text[:-1]
+    elif rng.random() < 0.05 and text.endswith(",00"):
+        text = text[:-3]
+
+    return ("-" if cents < 0 else "") + text
+
+
+def _row(
+    day: datetime.date, cp: Counterparty, n: int, spender: str, rng: random.Random
+) -> Dict[str, str]:
+    receiver = cp.receiver.format(other=[s for s in SPENDERS if s != spender][0])
+    return {
+        "Buchungstag": day.strftime("%d.%m.%Y"),
+        "Valuta": (day + datetime.timedelta(days=rng.randint(0, 2))).strftime(
+            "%d.%m.%Y"
+        ),
+        "Auftraggeber / Begünstigter": receiver,
+        "Zahler": spender,
+        "Verwendungszweck": cp.purpose.format(n=n),
+        "Betrag (EUR)": german_amount(rng.randint(cp.cents_min, cp.cents_max), rng),
+    }
+
+
+def write_statement(
+    filepath: Path,
+    rows: List[Dict[str, str]],
+    year: int,
+    preamble: bool = True,
+    labelled: bool = False,
+):
+    fieldnames = HEADINGS + ([LABEL_HEADING, COMMENT_HEADING] if labelled else [])
+    with open(filepath, "w", newline="") as f:
+        writer = csv.writer(f, delimiter=";", quoting=csv.QUOTE_ALL)
+        if preamble:
+            for line in PREAMBLE:
+                writer.writerow([cell.format(year=year) for cell in line])
+
+        dictwriter = csv.DictWriter(
+            f, fieldnames=fieldnames, delimiter=";", quoting=csv.QUOTE_ALL
+        )
+        dictwriter.writeheader()
+        dictwriter.writerows(rows)
+
+
+def write_regex_rules(filepath: Path, n: int, spender: str, rng: random.Random):
+    """
+    n Regeln, die ersten passen auf die Gegenparteien der Auszüge (als Teilstring
+    oder Regex), die übrigen sind Regeln wie aus den Jahren, die nichts mehr
+    treffen. Etwa jede dritte Regel ist ein echter Regex.
+    """
+    rules = []
+    for i, cp in enumerate(COUNTERPARTIES + [TRANSFER]):
+        receiver = cp.receiver.split()[0].format(other="|".join(SPENDERS))
+        purpose = ""
+        if i % 3 == 0:
+            receiver = f"^{receiver}"
+        if cp.label == "Gesundheit":
+            label = prefix_label(cp.label, spender)
+        else:
+            label = cp.label
+        rules.append([label, "", receiver, purpose])
+
+    while len(rules) < n:
+        i = len(rules)
+        if i % 3 == 0:
+            receiver, purpose = f"Altvertrag {i} (GmbH|AG)", ""
+        elif i % 3 == 1:
+            receiver, purpose = "", f"Kd-Nr 9{i:05d}"
+        else:
+            receiver, purpose = f"Laden {i}", ""
+        rules.append(
+            [rng.choice(["Sonstiges", "Freizeit", "Geschenke"]), "", receiver, purpose]
+        )
+
+    filepath.parent.mkdir(parents=True, exist_ok=True)
+    with open(filepath, "w", newline="") as f:
+        writer = csv.writer(f, delimiter=";", quoting=csv.QUOTE_ALL)
+        writer.writerow(
+            [
+                LABEL_HEADING,
+                COMMENT_HEADING,
+                "Auftraggeber / Begünstigter",
+                "Verwendungszweck",
+            ]
+        )
+        writer.writerows(rules[:n])
+
+
+def write_nonregex_rules(
+    filepath: Path, rows: List[Dict[str, str]], fraction: float, rng: random.Random
+):
+    """
+    Regeldatei zu einem Auszug, in der ein Anteil fraction der Zeilen schon von
+    Hand gelabelt ist. Die übrigen Zeilen ergänzt der Import selbst.
+    """
+    fieldnames = [LABEL_HEADING, COMMENT_HEADING] + HEADINGS
+    filepath.parent.mkdir(parents=True, exist_ok=True)
+    with open(filepath, "w", newline="") as f:
+        writer = csv.DictWriter(
+            f, fieldnames=fieldnames, delimiter=";", quoting=csv.QUOTE_ALL
+        )
+        writer.writeheader()
+        for row in rows:
+            if rng.random() < fraction:
+                writer.writerow(
+                    {
+                        LABEL_HEADING: rng.choice(["Sonstiges", "Freizeit"]),
+                        COMMENT_HEADING: "",
+                        **row,
+                    }
+                )
+
+
+def generate_account(
+    srcpath: Path,
+    name: str,
+    spender: str,
+    files: int = 3,
+    rows: int = 1000,
+    regex_rules: int = 50,
+    labelled_fraction: float = 0.05,
+    labelled: bool = False,
+    start_year: int = START_YEAR,
+    seed: int = 1,
+) -> Dict:
+    """Schreibt die Auszüge eines Kontos und gibt dessen Konfiguration zurück."""
+    rng = random.Random(f"{seed}-{name}")
+    srcpath.mkdir(parents=True, exist_ok=True)
+    for fi in range(files):
+        year = start_year + fi
+        days = sorted(
+            (
+                datetime.date(year, 1, 1) + datetime.timedelta(days=rng.randint(0, 364))
+                for _ in range(rows)
+            ),
+            reverse=True,
+        )
+        statement_rows = []
+        for n, day in enumerate(days):
+            cp = TRANSFER if rng.random() < 0.03 else rng.choice(COUNTERPARTIES)
+            row = _row(day, cp, n, spender, rng)
+            if labelled:
+                row[LABEL_HEADING] = rng.choice(
+                    [cp.label, f"{cp.label},{prefix_label(cp.label, spender)}"]
+                )
+                row[COMMENT_HEADING] = rng.choice(["", "gemeinsam"])
+            statement_rows.append(row)
+
+        filename = f"umsatz_{year}.csv"
+        write_statement(
+            srcpath.joinpath(filename),
+            statement_rows,
+            year,
+            preamble=fi % 2 == 0,
+            labelled=labelled,
+        )
+        if not labelled and labelled_fraction > 0:
+            write_nonregex_rules(
+                srcpath.joinpath("rules", filename),
+                statement_rows,
+                labelled_fraction,
+                rng,
+            )
+
+    if not labelled:
+        write_regex_rules(
+            srcpath.joinpath("rules", "regexrules.csv"), regex_rules, spender, rng
+        )
+
+    return dict(
+        name=name,
+        srcpath=str(srcpath),
+        csv_delimiter=";",
+        csv_encoding=None,
+        spender=spender,
+        heading_date="Buchungstag",
+        heading_value="Betrag (EUR)",
+        heading_receiver="Auftraggeber / Begünstigter",
+        heading_payer="Zahler",
+        heading_purpose="Verwendungszweck",
+        labelled=labelled,
+    )
+
+
+def generate(
+    outdir: Path,
+    files: int = 3,
+    rows: int = 1000,
+    regex_rules: int = 50,
+    labelled_fraction: float = 0.05,
+    seed: int = 1,
+    config: Optional[Path] = None,
+) -> List[Dict]:
+    """
+    Ein Konto je Spender und ein gemeinsames, schon gelabeltes Konto. Ein
+    vorhandenes outdir wird ersetzt.
+    """
+    outdir = Path(outdir)
+    if outdir.exists():
+        shutil.rmtree(outdir)
+
+    accounts = [
+        generate_account(
+            outdir.joinpath(f"konto_{spender.lower()}"),
+            f"Konto {spender}",
+            spender,
+            files=files,
+            rows=rows,
+            regex_rules=regex_rules,
+            labelled_fraction=labelled_fraction,
+            seed=seed,
+        )
+        for spender in SPENDERS
+    ]
+    accounts.append(
+        generate_account(
+            outdir.joinpath("gemeinsam"),
+            "Gemeinsam",
+            SPENDERS[0],
+            files=files,
+            rows=rows,
+            labelled=True,
+            seed=seed,
+        )
+    )
+
+    config = config if config else outdir.joinpath("config.yml")
+    config.write_text(yaml.safe_dump({"accounts": accounts}, allow_unicode=True))
+    return accounts
+
+
+@click.command()
+@click.argument("outdir", type=click.Path(file_okay=False, path_type=Path))
+@click.option(
+    "--files", default=3, type=click.IntRange(min=1), help="Statements per account"
+)
+@click.option(
+    "--rows", default=1000, type=click.IntRange(min=1), help="Rows per statement"
+)
+@click.option("--regex-rules", default=50, type=click.IntRange(min=0))
+@click.option(
+    "--labelled-fraction",
+    default=0.05,
+    type=click.FloatRange(0, 1),
+    help="Share of rows already labelled in the per-file rule files",
+)
+@click.option("--seed", default=1)
+def main(outdir, files, rows, regex_rules, labelled_fraction, seed):
+    generate(outdir, files, rows, regex_rules, labelled_fraction, seed)
+    print(outdir.joinpath("config.yml"))
+
+
+if __name__ == "__main__":
+    main()
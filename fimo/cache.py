@@ -0,0 +1,170 @@
+import hashlib
+import json
+import os
+import pickle
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, Hashable, Iterable, Optional, Tuple
+
+# bump when the layout of cached payloads changes
+CACHE_VERSION = 2
+
+
+def file_stat(filepath: Optional[Path]) -> Optional[Tuple[int, int]]:
+    if filepath is None or not filepath.exists():
+        return None
+
+    stat = filepath.stat()
+    return (stat.st_size, stat.st_mtime_ns)
+
+
+def file_digest(filepath: Optional[Path]) -> Optional[str]:
+    if filepath is None or not filepath.exists():
+        return None
+
+    return hashlib.sha1(filepath.read_bytes()).hexdigest()
+
+
+class Manifest:
+    """
+    Verzeichnis der Inhalts-Hashes von Quell- und Regeldateien eines Kontos.
+
+    Solange sich Größe und mtime einer Datei nicht ändern, wird der gespeicherte
+    Hash verwendet. Sonst wird neu gehasht, sodass z.B. erneut heruntergeladene,
+    aber unveränderte Kontoauszüge nicht als geändert gelten.
+    """
+
+    def __init__(self, filepath: Path, basepath: Path):
+        self._filepath = filepath
+        self._basepath = basepath
+        self._dirty = False
+        try:
+            self._entries: Dict[str, Dict] = json.loads(filepath.read_text())
+        except (OSError, ValueError):
+            self._entries = {}
+
+    def _key(self, filepath: Path) -> str:
+        return str(filepath.relative_to(self._basepath))
+
+    def digest(self, filepath: Optional[Path]) -> Optional[str]:
+        stat = file_stat(filepath)
+        if stat is None:
+            return None
+
+        key = self._key(filepath)
+        entry = self._entries.get(key)
+        if entry and tuple(entry["stat"]) == stat:
+            return entry["sha1"]
+
+        digest = file_digest(filepath)
+        self._entries[key] = {"stat": list(stat), "sha1": digest}
+        self._dirty = True
+        return digest
+
+    def prune(self):
+        """Entfernt Einträge von Dateien, die es nicht mehr gibt."""
+        for key in list(self._entries):
+            if not self._basepath.joinpath(key).exists():
+                del self._entries[key]
+                self._dirty = True
+
+    def save(self):
+        if not self._dirty:
+            return
+
+        if not self._filepath.parent.is_dir():
+            self._filepath.parent.mkdir()
+
+        self._filepath.write_text(json.dumps(self._entries, indent=1, sort_keys=True))
+        self._dirty = False
+
+
+class RecordCache:
+    """
+    Ablage der geparsten Einträge je Quelldatei.
+
+    Ein Eintrag ist nur gültig, solange der Fingerabdruck (Quelldatei, Regeln,
+    Kontokonfiguration, ...) mit dem beim Speichern übereinstimmt.
+    """
+
+    def __init__(self, cachedir: Path):
+        self._cachedir = cachedir
+
+    def _entrypath(self, filepath: Path) -> Path:
+        return self._cachedir.joinpath(filepath.name + ".pickle")
+
+    def load(self, filepath: Path, fingerprint: Any) -> Optional[Any]:
+        try:
+            with open(self._entrypath(filepath), "rb") as f:
+                entry = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+
+        if entry.get("fingerprint") != fingerprint:
+            return None
+
+        return entry["payload"]
+
+    def store(self, filepath: Path, fingerprint: Any, payload: Any):
+        if not self._cachedir.is_dir():
+            self._cachedir.mkdir()
+
+        entrypath = self._entrypath(filepath)
+        tmppath = entrypath.with_suffix(".tmp")
+        with open(tmppath, "wb") as f:
+            pickle.dump(
+                {"fingerprint": fingerprint, "payload": payload},
+                f,
+                protocol=pickle.HIGHEST_PROTOCOL,
+            )
+
+        os.replace(tmppath, entrypath)
+
+    def prune(self, filepaths: Iterable[Path]):
+        """Entfernt Einträge von Quelldateien, die es nicht mehr gibt."""
+        if not self._cachedir.is_dir():
+            return
+
+        keep = {self._entrypath(p) for p in filepaths}
+        for entrypath in self._cachedir.glob("*.pickle"):
+            if entrypath not in keep:
+                entrypath.unlink()
+
+
+class QueryCache:
+    """
+    Ergebnisse von Abfragen, höchstens maxsize Stück. Bei Überlauf fliegt das am
+    längsten nicht mehr verwendete Ergebnis raus.
+    """
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+
+    def get(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key]
+
+        self.misses += 1
+        result = compute()
+        if self.maxsize > 0:
+            self._entries[key] = result
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+        return result
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+        }
@@ -1,16 +1,30 @@
 import click
+import json
 import os
+import time
+import yaml
 
 from fimo.exception import FimoException
 
 from fimo import importer
-from pydantic_yaml import YamlModel
-from typing import List
+from pydantic import BaseModel
+from typing import List, Optional
 from pathlib import Path
 
 
-class FimoConfig(YamlModel):
+class FimoConfig(BaseModel):
     accounts: List[importer.Account]
+    # SQLite Datei für die Einträge, sonst bleiben sie im Speicher
+    database: Optional[Path] = None
+
+    @classmethod
+    def parse_yaml(cls, text: str) -> "FimoConfig":
+        return cls.parse_obj(yaml.safe_load(text))
+
+
+def _read_config(configfile) -> FimoConfig:
+    text = Path(configfile).read_text()
+    return FimoConfig.parse_yaml(text)
 
 
 @click.command()
@@ -21,21 +35,211 @@ class FimoConfig(YamlModel):
     required=True,
     default=os.environ["HOME"] + "/.fimo.yml",
 )
-def fimo_import(configfile):
+@click.option(
+    "--no-cache",
+    "no_cache",
+    is_flag=True,
+    default=False,
+    help="Reparse all files instead of loading unchanged ones from the cache",
+)
+@click.option(
+    "-j",
+    "--jobs",
+    "jobs",
+    default=1,
+    type=click.IntRange(min=1),
+    help="Number of processes importing statement files in parallel",
+)
+@click.option(
+    "-w",
+    "--watch",
+    "watch",
+    is_flag=True,
+    default=False,
+    help="Keep running and apply changed statement and rule files incrementally",
+)
+@click.option(
+    "--interval",
+    "interval",
+    default=1.0,
+    type=click.FloatRange(min=0.1),
+    help="Seconds between checks for changed files in watch mode",
+)
+@click.option(
+    "--profile",
+    "profile",
+    type=click.File("w"),
+    default=None,
+    help="Write the time spent per import stage, file and account as JSON "
+    "to this file (- for stdout)",
+)
+@click.option(
+    "--rule-report",
+    "rule_report",
+    type=click.File("w"),
+    default=None,
+    help="Write hits, evaluation time and never firing or shadowed rules of each "
+    "regexrules.csv as JSON to this file (- for stdout), reparses all files",
+)
+def fimo_import(configfile, no_cache, jobs, watch, interval, profile, rule_report):
+    if watch and (profile or rule_report):
+        raise click.UsageError(
+            "--profile and --rule-report can't be used together with --watch"
+        )
+    if watch and jobs > 1:
+        # watch mode keeps the rows of all files, they are parsed in this process
+        raise click.UsageError("--jobs can't be used together with --watch")
+
     try:
-        text = Path(configfile).read_text()
-        cfg = FimoConfig.parse_raw(text)
+        cfg = _read_config(configfile)
+        if watch:
+            _watch_import(cfg.accounts, interval, use_cache=not no_cache)
+            return
 
-        importers = []
-        for acc in cfg.accounts:
-            print(f"Importing from {acc.name}")
-            imp = importer.AccountImporter(acc)
-            importers.append(imp)
-            imp.do_import()
+        importers = importer.import_accounts(
+            cfg.accounts,
+            use_cache=not no_cache and rule_report is None,
+            workers=jobs,
+            profile=profile is not None,
+            rule_stats=rule_report is not None,
+        )
+        for acc, imp in zip(cfg.accounts, importers):
+            print(
+                f"Imported from {acc.name}: "
+                f"{len(imp.reimported_files())} new or changed files"
+            )
 
         for imp in importers:
             if imp.import_errors():
                 print(f"Warning: {imp.import_errors()[0]}")
+            for warning in imp.overlap_warnings():
+                print(f"Warning: {warning}")
+
+        if profile:
+            report = {"accounts": [imp.profile_report() for imp in importers]}
+            profile.write(json.dumps(report, indent=2) + "\n")
+
+        if rule_report:
+            reports = [imp.rule_report() for imp in importers]
+            report = {"accounts": [r for r in reports if r is not None]}
+            rule_report.write(json.dumps(report, indent=2) + "\n")
+
+    except FimoException as e:
+        print(f"Error: {e}")
+        print(f"Exiting")
+        exit(1)
+
+
+def _watch_import(
+    accounts: List[importer.Account], interval: float, use_cache: bool = True
+):
+    from fimo.watch import SourceWatcher
+
+    catalog = importer.SourceCatalog()
+    importers = []
+    for acc in accounts:
+        imp = importer.AccountImporter(
+            acc, use_cache=use_cache, catalog=catalog, keep_rows=True
+        )
+        imp.do_import()
+        importers.append(imp)
+        print(f"Imported from {acc.name}: {len(imp.files())} files")
+        if imp.import_errors():
+            print(f"Warning: {imp.import_errors()[0]}")
+        for warning in imp.overlap_warnings():
+            print(f"Warning: {warning}")
+
+    watcher = SourceWatcher(accounts)
+    pending = [set() for _ in accounts]
+    print("Watching for changes, stop with Ctrl-C")
+    try:
+        while True:
+            time.sleep(interval)
+            changed = watcher.poll()
+            for acc, imp, paths in zip(accounts, importers, pending):
+                new = [p for p in changed if acc.srcpath in [p.parent, p.parent.parent]]
+                if not new:
+                    continue
+
+                paths.update(new)
+                try:
+                    updated = imp.update(paths)
+                except Exception as e:
+                    # keep the changes, they are retried with the next edit
+                    print(f"Error: {e}")
+                    continue
+
+                # rule files rewritten by the import show up with the next poll,
+                # the files are relabelled once more with their final line numbers
+                paths.clear()
+                if updated:
+                    print(f"Updated {acc.name}: " + ", ".join(p.name for p in updated))
+                if imp.import_errors():
+                    print(f"Warning: {imp.import_errors()[0]}")
+                if updated:
+                    for warning in imp.overlap_warnings():
+                        print(f"Warning: {warning}")
+
+    except KeyboardInterrupt:
+        pass
+
+
+@click.command()
+@click.option(
+    "-c",
+    "--config-file",
+    "configfile",
+    required=True,
+    default=os.environ["HOME"] + "/.fimo.yml",
+)
+@click.option(
+    "-s",
+    "--socket",
+    "socketpath",
+    default=os.environ["HOME"] + "/.fimo.sock",
+    help="Unix socket to listen on",
+)
+@click.option(
+    "--interval",
+    "interval",
+    default=2.0,
+    type=click.FloatRange(min=0.1),
+    help="Seconds between checks for changed statement and rule files",
+)
+@click.option(
+    "--no-cache",
+    "no_cache",
+    is_flag=True,
+    default=False,
+    help="Reparse all files instead of loading unchanged ones from the cache",
+)
+@click.option(
+    "-j",
+    "--jobs",
+    "jobs",
+    default=1,
+    type=click.IntRange(min=1),
+    help="Number of processes importing statement files in parallel",
+)
+def fimo_serve(configfile, socketpath, interval, no_cache, jobs):
+    """Answers queries over a unix socket (JSON-RPC) with the data kept in memory."""
+    try:
+        from fimo import server
+
+        cfg = _read_config(configfile)
+        srv = server.FimoServer(
+            cfg.accounts,
+            socketpath=Path(socketpath),
+            poll_interval=interval,
+            use_cache=not no_cache,
+            workers=jobs,
+            database=cfg.database,
+        )
+        print(f"Serving on {socketpath}")
+        srv.serve_forever()
+
+    except KeyboardInterrupt:
+        pass
 
     except FimoException as e:
         print(f"Error: {e}")
@@ -43,5 +247,14 @@ def fimo_import(configfile):
         exit(1)
 
 
+@click.group()
+def fimo():
+    pass
+
+
+fimo.add_command(fimo_import, name="import")
+fimo.add_command(fimo_serve, name="serve")
+
+
 if __name__ == "__main__":
-    fimo_import()
+    fimo()
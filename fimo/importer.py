@@ -1,36 +1,165 @@
 import csv
 import datetime
 import glob
+import hashlib
+import io
+import itertools
 import re
-import shutil
+import time
+
+try:
+    from re import _constants as sre_constants
+    from re import _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_constants
+    import sre_parse
+from collections import Counter
+from concurrent.futures import Executor
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 
 from pydantic import BaseModel
 
+from fimo.cache import CACHE_VERSION, Manifest, RecordCache, file_stat
 from fimo.exception import FimoException
+from fimo.profiling import StageProfile, stage
 
 LABEL_HEADING = "KPZ_Label"
 COMMENT_HEADING = "KPZ_Comment"
 RULE_SRC = "RULE_SRC"
 
 
+# the preamble before the header is only searched for in the first lines
+HEADER_SEARCH_LINES = 16
+
+
 def _remove_stuff_before_header(lines) -> int:
     # remove stuff before header line, it's separated by a blank line
     found = False
-    for i, line in enumerate(lines[15::-1]):
+    for i, line in enumerate(lines[HEADER_SEARCH_LINES - 1 :: -1]):
         if line == "\n" or line == '""\n':
             found = True
             break
 
     k = 0
     if found:
-        k = 15 - i + 1
+        k = HEADER_SEARCH_LINES - 1 - i + 1
         del lines[:k]
 
     return k + 1
 
 
+def _lines_from_header(f: Iterable[str]) -> Tuple[Iterator[str], int]:
+    """
+    Die Zeilen ab der Kopfzeile und die Anzahl der Zeilen bis einschließlich
+    Kopfzeile, ohne die Datei komplett einzulesen.
+    """
+    prefix = list(itertools.islice(f, HEADER_SEARCH_LINES))
+    n_skipped_lines = _remove_stuff_before_header(prefix)
+    return itertools.chain(prefix, f), n_skipped_lines
+
+
+def _unique_lines(
+    lines: Iterable[str], filepath: Path, profile: Optional[StageProfile] = None
+) -> Iterator[str]:
+    # only hashes of the lines are kept, not the lines themselves; checked in
+    # chunks, so a profile can tell the check apart from reading
+    seen = set()
+    lines = iter(lines)
+    while chunk := list(itertools.islice(lines, NORMALIZE_CHUNK_ROWS)):
+        with stage(profile, "duplicates"):
+            for line in chunk:
+                h = hash(line)
+                if h in seen:
+                    raise FimoException(f"Found duplicates in file {filepath}")
+
+                seen.add(h)
+        if profile is not None:
+            profile.add_rows("duplicates", len(chunk))
+
+        yield from chunk
+
+
+# rows are normalized in chunks, so labelled accounts can still be streamed
+NORMALIZE_CHUNK_ROWS = 4096
+
+_GERMAN_DATE = re.compile(r"[0-9]{2}\.[0-9]{2}\.[0-9]{4}")
+_ONE_DECIMAL_AMOUNT = re.compile("-?[0-9]+,[0-9]$")
+_TWO_DECIMAL_AMOUNTS = re.compile(
+    r"(?:-?[0-9]{1,16},[0-9]{2}\n)*-?[0-9]{1,16},[0-9]{2}"
+)
+
+
+class _ColumnError(ValueError):
+    def __init__(self, index: int, text: str):
+        super().__init__(text)
+        self.index = index
+        self.text = text
+
+
+def _parse_dates(texts: List[str], date_format: str) -> List[datetime.date]:
+    """
+    Parst eine Datumsspalte. Jeder Text wird nur einmal geparst, für %d.%m.%Y
+    ohne strptime, wenn er genau diese Form hat.
+    """
+    german = date_format == "%d.%m.%Y"
+    parsed = {}
+    dates = []
+    for i, text in enumerate(texts):
+        date = parsed.get(text)
+        if date is None:
+            try:
+                if german and _GERMAN_DATE.fullmatch(text):
+                    date = datetime.date(int(text[6:]), int(text[3:5]), int(text[:2]))
+                else:
+                    date = datetime.datetime.strptime(text, date_format).date()
+            except (TypeError, ValueError):
+                raise _ColumnError(i, text)
+
+            parsed[text] = date
+
+        dates.append(date)
+
+    return dates
+
+
+def _parse_amount(text: str) -> int:
+    val_str = text.replace(".", "")
+    if _ONE_DECIMAL_AMOUNT.match(val_str):
+        val_str = val_str.replace(",", "") + "0"
+    else:
+        val_str = val_str.replace(",", "") if "," in val_str else val_str + "00"
+    return int(val_str)
+
+
+def _parse_amounts(texts: List[str]) -> List[int]:
+    """
+    Parst eine Spalte deutscher Beträge in Cent.
+
+    Haben alle Beträge zwei Nachkommastellen, wird die ganze Spalte mit einem
+    Regex auf einmal geprüft und ohne weitere Fallunterscheidung umgewandelt,
+    sonst jeder Betrag einzeln.
+    """
+    try:
+        joined = "\n".join(texts).replace(".", "")
+    except TypeError:
+        joined = ""
+
+    if joined and _TWO_DECIMAL_AMOUNTS.fullmatch(joined):
+        cents = joined.replace(",", "").split("\n")
+        if len(cents) == len(texts):
+            return list(map(int, cents))
+
+    amounts = []
+    for i, text in enumerate(texts):
+        try:
+            amounts.append(_parse_amount(text))
+        except (AttributeError, ValueError):
+            raise _ColumnError(i, text)
+
+    return amounts
+
+
 class Account(BaseModel):
     name: str
     srcpath: Path
@@ -44,6 +173,8 @@ class Account(BaseModel):
     heading_purpose: str
     labelled: bool = False
     date_format: str = "%d.%m.%Y"
+    # Buchungen, die schon in einem früheren Auszug stehen, nicht übernehmen
+    skip_overlaps: bool = False
 
 
 class RecordSource(BaseModel):
@@ -68,25 +199,385 @@ class AccountRecord(BaseModel):
     labels_src: List[RecordSource]
 
 
+class SourceCatalog:
+    """
+    Konten, Dateien und Texte, auf die Record per Index verweist.
+
+    Empfänger, Zahler, Verwendungszweck, Labels und Kommentare wiederholen sich
+    über die Jahre, jeder Text liegt nur einmal in texts. Labels und Kommentar
+    eines Eintrags sind Listen von Textcodes in text_lists, ebenfalls nur einmal
+    je Kombination. Mehrere AccountImporter können sich einen Katalog teilen.
+    """
+
+    def __init__(self):
+        self.accounts: List[Account] = []
+        self.files: List[Path] = []
+        self._file_ids: Dict[Path, int] = {}
+        self.texts: List[str] = []
+        self._text_ids: Dict[str, int] = {}
+        self.text_lists: List[Tuple[int, ...]] = []
+        self._list_ids: Dict[Tuple[int, ...], int] = {}
+        # "a,b" -> Code der Liste ["a", "b"], so wie die Spalten eingelesen werden
+        self._split_ids: Dict[str, int] = {}
+
+    def account_id(self, account: Account) -> int:
+        for i, a in enumerate(self.accounts):
+            if a is account:
+                return i
+
+        self.accounts.append(account)
+        return len(self.accounts) - 1
+
+    def file_id(self, filepath: Path) -> int:
+        if filepath not in self._file_ids:
+            self._file_ids[filepath] = len(self.files)
+            self.files.append(filepath)
+
+        return self._file_ids[filepath]
+
+    def source(self, ref: Tuple[int, int]) -> RecordSource:
+        return RecordSource.construct(filepath=self.files[ref[0]], linenumber=ref[1])
+
+    def text_id(self, text: str) -> int:
+        code = self._text_ids.get(text)
+        if code is None:
+            code = self._text_ids[text] = len(self.texts)
+            self.texts.append(text)
+
+        return code
+
+    def list_id(self, codes: Tuple[int, ...]) -> int:
+        code = self._list_ids.get(codes)
+        if code is None:
+            code = self._list_ids[codes] = len(self.text_lists)
+            self.text_lists.append(codes)
+
+        return code
+
+    def text_list_id(self, texts: Iterable[str]) -> int:
+        return self.list_id(tuple(self.text_id(t) for t in texts))
+
+    def split_id(self, text: str) -> int:
+        """Code der Liste text.split(",")."""
+        code = self._split_ids.get(text)
+        if code is None:
+            code = self._split_ids[text] = self.text_list_id(text.split(","))
+
+        return code
+
+    def text_list(self, code: int) -> List[str]:
+        return [self.texts[i] for i in self.text_lists[code]]
+
+
+class Record:
+    """
+    Kompakte Form eines AccountRecord, wie sie Import und Monitor intern verwenden.
+
+    Konto und Quellen sind Verweise (Index, Zeile) in einen SourceCatalog, die
+    Texte Codes in dessen Wörterbuch. Die Attribute von AccountRecord sind als
+    Properties verfügbar, to_model() liefert das pydantic Modell.
+    """
+
+    __slots__ = (
+        "catalog",
+        "account_id",
+        "date",
+        "value",
+        "receiver_id",
+        "payer_id",
+        "purpose_id",
+        "labels_id",
+        "comment_id",
+        "src_ref",
+        "preview_ref",
+        "labels_src_refs",
+    )
+
+    def __init__(
+        self,
+        catalog: SourceCatalog,
+        account_id: int,
+        date: datetime.date,
+        value: int,
+        receiver_id: int,
+        payer_id: int,
+        purpose_id: int,
+        labels_id: int,
+        comment_id: int,
+        src_ref: Tuple[int, int],
+        preview_ref: Optional[Tuple[int, int]],
+        labels_src_refs: Tuple[Tuple[int, int], ...],
+    ):
+        self.catalog = catalog
+        self.account_id = account_id
+        self.date = date
+        self.value = value
+        self.receiver_id = receiver_id
+        self.payer_id = payer_id
+        self.purpose_id = purpose_id
+        self.labels_id = labels_id
+        self.comment_id = comment_id
+        self.src_ref = src_ref
+        self.preview_ref = preview_ref
+        self.labels_src_refs = labels_src_refs
+
+    @property
+    def receiver(self) -> str:
+        return self.catalog.texts[self.receiver_id]
+
+    @property
+    def payer(self) -> str:
+        return self.catalog.texts[self.payer_id]
+
+    @property
+    def purpose(self) -> str:
+        return self.catalog.texts[self.purpose_id]
+
+    @property
+    def labels(self) -> List[str]:
+        return self.catalog.text_list(self.labels_id)
+
+    @property
+    def comment(self) -> List[str]:
+        return self.catalog.text_list(self.comment_id)
+
+    @property
+    def account(self) -> Account:
+        return self.catalog.accounts[self.account_id]
+
+    @property
+    def spender(self) -> str:
+        return self.account.spender
+
+    @property
+    def src(self) -> RecordSource:
+        return self.catalog.source(self.src_ref)
+
+    @property
+    def preview_src(self) -> Optional[RecordSource]:
+        return self.catalog.source(self.preview_ref) if self.preview_ref else None
+
+    @property
+    def labels_src(self) -> List[RecordSource]:
+        return [self.catalog.source(ref) for ref in self.labels_src_refs]
+
+    def to_model(self) -> AccountRecord:
+        return AccountRecord(
+            account=self.account,
+            date=self.date,
+            spender=self.spender,
+            value=self.value,
+            receiver=self.receiver,
+            payer=self.payer,
+            purpose=self.purpose,
+            labels=self.labels,
+            comment=self.comment,
+            src=self.src,
+            preview_src=self.preview_src,
+            labels_src=self.labels_src,
+        )
+
+    def __repr__(self):
+        return f"Record({self.date}, {self.value}, {self.labels}, {self.src_ref})"
+
+
 REGEX_RULE_FILENAME = "regexrules.csv"
 RULES_SUBDIR = "rules"
 PREVIEW_SUBDIR = "preview"
+CACHE_SUBDIR = "cache"
+MANIFEST_FILENAME = "manifest.json"
+
+
+def _pack_records(records: List[Record]) -> Dict:
+    """
+    Kompakte, spaltenweise Darstellung der Einträge einer Datei für den Cache.
+    Texte und Listen von Texten sind Codes in ein eigenes Wörterbuch der Datei.
+    """
+    paths = {}
+    texts = {}
+    lists = {}
+
+    def path_id(file_id: int) -> int:
+        return paths.setdefault(str(records[0].catalog.files[file_id]), len(paths))
+
+    def text_id(code: int) -> int:
+        return texts.setdefault(code, len(texts))
+
+    def list_id(code: int) -> int:
+        return lists.setdefault(code, len(lists))
+
+    columns = {
+        "date": [r.date.toordinal() for r in records],
+        "value": [r.value for r in records],
+        "receiver": [text_id(r.receiver_id) for r in records],
+        "payer": [text_id(r.payer_id) for r in records],
+        "purpose": [text_id(r.purpose_id) for r in records],
+        "labels": [list_id(r.labels_id) for r in records],
+        "comment": [list_id(r.comment_id) for r in records],
+        "line": [r.src_ref[1] for r in records],
+        "preview_line": [r.preview_ref[1] if r.preview_ref else None for r in records],
+        "labels_src": [
+            [(path_id(f), l) for f, l in r.labels_src_refs] for r in records
+        ],
+        "paths": list(paths),
+    }
+    if records:
+        catalog = records[0].catalog
+        columns["lists"] = [
+            [text_id(c) for c in catalog.text_lists[code]] for code in lists
+        ]
+        columns["texts"] = [catalog.texts[code] for code in texts]
+    else:
+        columns["lists"] = columns["texts"] = []
+
+    return columns
+
+
+def _unpack_records(
+    columns: Dict,
+    catalog: SourceCatalog,
+    account: Account,
+    filepath: Path,
+    previewfilepath: Optional[Path],
+) -> List[Record]:
+    account_id = catalog.account_id(account)
+    src_id = catalog.file_id(filepath)
+    preview_id = catalog.file_id(previewfilepath) if previewfilepath else None
+    file_ids = [catalog.file_id(Path(p)) for p in columns["paths"]]
+    text_ids = [catalog.text_id(t) for t in columns["texts"]]
+    list_ids = [
+        catalog.list_id(tuple(text_ids[c] for c in codes)) for codes in columns["lists"]
+    ]
+    return [
+        Record(
+            catalog,
+            account_id,
+            datetime.date.fromordinal(columns["date"][i]),
+            columns["value"][i],
+            text_ids[columns["receiver"][i]],
+            text_ids[columns["payer"][i]],
+            text_ids[columns["purpose"][i]],
+            list_ids[columns["labels"][i]],
+            list_ids[columns["comment"][i]],
+            (src_id, line),
+            (preview_id, columns["preview_line"][i])
+            if preview_id is not None
+            else None,
+            tuple((file_ids[f], l) for f, l in columns["labels_src"][i]),
+        )
+        for i, line in enumerate(columns["line"])
+    ]
 
 
 class AccountImporter:
-    def __init__(self, account: Account):
+    def __init__(
+        self,
+        account: Account,
+        use_cache: bool = True,
+        catalog: Optional[SourceCatalog] = None,
+        keep_rows: bool = False,
+        profile: bool = False,
+        rule_stats: bool = False,
+    ):
+        """
+        Mit keep_rows werden alle Dateien eingelesen (nicht aus dem Cache geladen)
+        und ihre Zeilen behalten, damit update() Regeländerungen übernehmen kann,
+        ohne die Kontoauszüge erneut zu lesen.
+
+        Mit profile werden die Zeiten der einzelnen Stufen je Datei gemessen, siehe
+        profile_report(). Mit rule_stats werden Treffer und Rechenzeit der
+        Regex-Regeln gezählt, siehe rule_report().
+        """
         self._account = account
+        self._catalog = catalog if catalog else SourceCatalog()
+        self._keep_rows = keep_rows
+        self._profile = StageProfile() if profile else None
+        self._rule_stats = rule_stats
+        # files whose labels changed with the regex rules, until relabelled
+        self._stale = set()
+        # overlapping records per file and (overlap, earlier occurrence) src refs
+        self._overlapping: Dict[Path, set] = {}
+        self._overlaps: List[Tuple[Tuple[int, int], Tuple[int, int]]] = []
+        self._cache = None
+        self._manifest = None
+        if use_cache:
+            cachedir = account.srcpath.joinpath(CACHE_SUBDIR)
+            self._cache = RecordCache(cachedir)
+            self._manifest = Manifest(
+                cachedir.joinpath(MANIFEST_FILENAME), account.srcpath
+            )
 
-    def do_import(self):
-        self._import()
-
-    def data(self) -> List[AccountRecord]:
+    def do_import(self, executor: Optional[Executor] = None):
+        """
+        Importiert alle Kontoauszüge des Kontos. Mit executor werden die Dateien,
+        die nicht aus dem Cache kommen, in dessen Worker-Prozessen eingelesen.
+        """
+        self._start_import(executor)
+        self._finish_import()
+
+    def data(self) -> List[Record]:
+        """Einträge aller Dateien, mit skip_overlaps ohne die Überschneidungen."""
+        skip = self._account.skip_overlaps
         data = []
         for fimp in self._file_importers:
-            data.extend(fimp.data())
+            overlapping = self._overlapping.get(fimp._filepath) if skip else None
+            if overlapping:
+                data.extend(
+                    r for i, r in enumerate(fimp.data()) if i not in overlapping
+                )
+            else:
+                data.extend(fimp.data())
 
         return data
 
+    def overlaps(self) -> List[Tuple[RecordSource, RecordSource]]:
+        """
+        Buchungen, die schon in einem früheren Auszug des Kontos stehen, jeweils
+        mit dem früheren Vorkommen.
+        """
+        return [
+            (self._catalog.source(ref), self._catalog.source(earlier))
+            for ref, earlier in self._overlaps
+        ]
+
+    def overlap_warnings(self) -> List[str]:
+        """Je Paar von Dateien eine Meldung mit den Zeilen der Überschneidungen."""
+        lines: Dict[Tuple[int, int], List[int]] = {}
+        for ref, earlier in self._overlaps:
+            lines.setdefault((ref[0], earlier[0]), []).append(ref[1])
+
+        action = "skipped" if self._account.skip_overlaps else "counted twice"
+        warnings = []
+        for (file_id, earlier_id), numbers in lines.items():
+            shown = ", ".join(str(n) for n in numbers[:OVERLAP_LINES_SHOWN])
+            if len(numbers) > OVERLAP_LINES_SHOWN:
+                shown += ", ..."
+            warnings.append(
+                f"{len(numbers)} transactions in {self._catalog.files[file_id]} "
+                f"are already in {self._catalog.files[earlier_id]} ({action}), "
+                f"lines {shown}"
+            )
+
+        return warnings
+
+    def _index_overlaps(self):
+        index = OverlapIndex()
+        self._overlapping = {}
+        for fimp in self._file_importers:
+            overlapping = index.add_file(fimp.data())
+            if overlapping:
+                self._overlapping[fimp._filepath] = set(overlapping)
+
+        self._overlaps = index.collisions
+
+    def files(self) -> List[Path]:
+        """Alle Quelldateien des letzten Imports."""
+        return [fimp._filepath for fimp in self._file_importers]
+
+    def reimported_files(self) -> List[Path]:
+        """Dateien, die beim letzten Import neu eingelesen werden mussten."""
+        return [fimp._filepath for fimp in self._file_importers if not fimp.cached]
+
     def import_errors(self):
         import_errors = []
         for fimp in self._file_importers:
@@ -94,6 +585,48 @@ class AccountImporter:
 
         return import_errors
 
+    def profile_report(self) -> Optional[Dict]:
+        """
+        Zeiten, Zeilen und Regeltreffer je Stufe, für das Konto insgesamt und je
+        Datei. None, wenn der Import ohne profile lief.
+        """
+        if self._profile is None:
+            return None
+
+        files = []
+        for fimp in self._file_importers:
+            report = fimp.profile.report()
+            report.update(
+                file=str(fimp._filepath), cached=fimp.cached, rows=len(fimp.data())
+            )
+            files.append(report)
+
+        total = StageProfile.total(
+            [self._profile] + [fimp.profile for fimp in self._file_importers]
+        )
+        report = total.report()
+        report.update(
+            account=self._account.name,
+            rows=sum(f["rows"] for f in files),
+            files=files,
+        )
+        return report
+
+    def rule_report(self) -> Optional[Dict]:
+        """
+        Treffer, Rechenzeit und nie oder nur verdeckt greifende Regeln der
+        Regex-Regeldatei über die eingelesenen (nicht aus dem Cache geladenen)
+        Dateien. None ohne rule_stats oder bei gelabelten Konten.
+        """
+        if not self._rule_stats or self._account.labelled:
+            return None
+
+        report = self._regex_engine.stats.report(
+            self._regex_rules, self._regexrulesfilepath
+        )
+        report["account"] = self._account.name
+        return report
+
     def _create_rule_file_fieldnames(self, fieldnames: List):
         fieldnames_copy = []
         fieldnames_copy.extend(fieldnames)
@@ -116,61 +649,742 @@ class AccountImporter:
 
         return sortedfieldnames
 
-    def _import(self):
+    def _read_regex_rules(self):
+        with stage(self._profile, "rules_load"):
+            self._read_regex_rules_file()
+
+    def _read_regex_rules_file(self):
+        self._regexrulesfilepath = self._account.srcpath.joinpath(
+            RULES_SUBDIR, REGEX_RULE_FILENAME
+        )
+        if self._regexrulesfilepath.exists():
+            with CSVReader(self._regexrulesfilepath, delimiter=";") as reader:
+                self._regex_rules = [row for row in reader]
+        else:
+            self._regex_rules = []
+
+        self._regex_engine = RuleEngine(
+            self._regex_rules, True, self._regexrulesfilepath
+        )
+        if self._rule_stats:
+            self._regex_engine.collect_stats()
+
+    def _start_import(self, executor: Optional[Executor]):
+        self._file_importers = []
+        self._pending = []
+
+        for filepath in self._prepare():
+            fimp = FileImporter(filepath, self)
+            self._file_importers.append(fimp)
+            if not self._keep_rows and fimp._load_cached():
+                continue
+
+            if executor and not self._keep_rows:
+                future = executor.submit(
+                    _import_file,
+                    self._account,
+                    filepath,
+                    self._profile is not None,
+                    self._rule_stats,
+                )
+                self._pending.append((fimp, future))
+            else:
+                fimp._parse()
+                fimp._store_cached()
+
+    def import_each(
+        self, unchanged: Optional[Callable[[Path, str], bool]] = None
+    ) -> Iterator[Tuple["FileImporter", Optional[str]]]:
+        """
+        Importiert die Kontoauszüge nacheinander und gibt jeden zusammen mit dem
+        Fingerabdruck seiner Eingaben zurück, ohne die Einträge zu behalten. Beim
+        Übertragen in eine Datenbank liegt so nur eine Datei im Speicher.
+
+        Dateien, für die unchanged(filepath, fingerprint) wahr ist, werden nicht
+        importiert. Ohne Cache gibt es keinen Fingerabdruck (None).
+        """
         self._file_importers = []
+        self._pending = []
 
+        for filepath in self._prepare():
+            fimp = FileImporter(filepath, self)
+            if self._manifest and unchanged:
+                if unchanged(filepath, fimp._fingerprint_digest()):
+                    continue
+
+            if not fimp._load_cached():
+                fimp._parse()
+                fimp._store_cached()
+
+            # the import may rewrite rule and preview files the fingerprint covers
+            yield fimp, fimp._fingerprint_digest() if self._manifest else None
+
+        self._finish_import()
+
+    def _prepare(self) -> List[Path]:
+        """Legt die Verzeichnisse an, liest die Regex-Regeln, gibt die Auszüge zurück."""
         if not self._account.labelled:
             rulesdir = self._account.srcpath.joinpath(RULES_SUBDIR)
             if not rulesdir.is_dir():
                 rulesdir.mkdir()
 
             previewdir = self._account.srcpath.joinpath(PREVIEW_SUBDIR)
-            if previewdir.exists():
-                shutil.rmtree(previewdir)
-
             if not previewdir.is_dir():
                 previewdir.mkdir()
 
-            # read the regex rule file
-            self._regexrulesfilepath = rulesdir.joinpath(REGEX_RULE_FILENAME)
-            if self._regexrulesfilepath.exists():
-                regex_rule_reader = CSVReader(self._regexrulesfilepath, delimiter=";")
-                self._regex_rules = [row for row in regex_rule_reader]
-            else:
-                self._regex_rules = []
+            self._read_regex_rules()
+
+        with stage(self._profile, "scan"):
+            # import src files
+            files = sorted(
+                Path(f) for f in glob.glob(str(self._account.srcpath.joinpath("*.csv")))
+            )
 
-        # import src files
-        files = glob.glob(str(self._account.srcpath.joinpath("*.csv")))
+            if not self._account.labelled:
+                # previews of vanished src files are stale, the others get rewritten
+                # on import or are still valid for cached files
+                names = {f.name for f in files}
+                for previewfile in previewdir.glob("*.csv"):
+                    if previewfile.name not in names:
+                        previewfile.unlink()
+
+            if self._cache:
+                self._cache.prune(files)
+
+        return files
+
+    def update(self, changed: Iterable[Path]) -> List[Path]:
+        """
+        Übernimmt Änderungen an Kontoauszügen und Regeldateien seit dem letzten
+        Import, z.B. die Dateien von SourceWatcher.poll().
+
+        Neue und geänderte Kontoauszüge werden eingelesen, gelöschte entfernt. Bei
+        geänderten Regeln werden nur die hinzugekommenen Regeln auf die behaltenen
+        Zeilen angewendet und nur die Dateien neu beschriftet, bei denen sich
+        dadurch etwas ändert. Nur deren Regel- und Vorschaudateien werden neu
+        geschrieben.
+
+        Gibt die Kontoauszüge zurück, deren Einträge neu erzeugt wurden. Schlägt
+        update() fehl, kann es mit denselben Dateien wiederholt werden.
+        """
+        changed = set(changed)
+        labelled = self._account.labelled
+
+        rules_changed = not labelled and self._regexrulesfilepath in changed
+        if rules_changed:
+            self._stale |= self._update_regex_rules()
+
+        files = sorted(
+            Path(f) for f in glob.glob(str(self._account.srcpath.joinpath("*.csv")))
+        )
+        previous = {fimp._filepath: fimp for fimp in self._file_importers}
+
+        file_importers = []
+        updated = []
         for filepath in files:
-            fimp = FileImporter(Path(filepath), self)
-            fimp.do_import()
-            self._file_importers.append(fimp)
+            fimp = previous.get(filepath)
+            if fimp is None or filepath in changed:
+                fimp = FileImporter(filepath, self)
+                fimp._parse()
+            elif not labelled and (
+                filepath in self._stale or fimp._rulefilepath in changed
+            ):
+                if fimp._raw_rows is None:
+                    fimp._parse()
+                else:
+                    fimp._relabel()
+            else:
+                file_importers.append(fimp)
+                continue
 
+            self._stale.discard(filepath)
+            file_importers.append(fimp)
+            updated.append(filepath)
 
-def _has_duplicates(alist: List):
-    return len(set(alist)) != len(alist)
+        self._file_importers = file_importers
 
+        if not labelled:
+            names = {f.name for f in files}
+            previewdir = self._account.srcpath.joinpath(PREVIEW_SUBDIR)
+            for previewfile in previewdir.glob("*.csv"):
+                if previewfile.name not in names:
+                    previewfile.unlink()
+
+        if self._cache:
+            self._cache.prune(files)
+            # the fingerprints of all files depend on the regex rules
+            for fimp in self._file_importers:
+                if rules_changed or fimp._filepath in updated:
+                    fimp._store_cached()
+
+            self._manifest.prune()
+            self._manifest.save()
+
+        self._index_overlaps()
+        return updated
+
+    def _update_regex_rules(self) -> set:
+        """
+        Liest die Regex-Regeln neu und passt die Treffer der behaltenen Zeilen an.
+        Unveränderte Regeln behalten ihre Treffer, nur hinzugekommene Regeln werden
+        geprüft. Gibt die Dateien zurück, bei denen sich Beschriftungen ändern.
+        """
+        old_rules = self._regex_rules
+        old_engine = self._regex_engine
+        try:
+            self._read_regex_rules()
+        except Exception:
+            self._regex_rules = old_rules
+            self._regex_engine = old_engine
+            raise
+
+        new_rules = self._regex_rules
+
+        # identical rules are assigned in file order
+        positions: Dict[frozenset, List[int]] = {}
+        for j, rule in enumerate(new_rules):
+            positions.setdefault(_row_key(rule), []).append(j)
+
+        mapping = {}
+        for i, rule in enumerate(old_rules):
+            candidates = positions.get(_row_key(rule))
+            if candidates:
+                mapping[i] = candidates.pop(0)
+
+        mapped = set(mapping.values())
+        added = [j for j in range(len(new_rules)) if j not in mapped]
+        added_engine = RuleEngine(
+            [new_rules[j] for j in added], True, self._regexrulesfilepath
+        )
 
-def _apply_rules(
-    adict: Dict, rules: List[Dict], regex_cmp: bool, overwrite: bool, rulespath: Path
-):
+        def result(rules, matches):
+            # with overwrite the last matching rule decides
+            if not matches:
+                return None
+            rule = rules[matches[-1]]
+            return (rule[LABEL_HEADING], rule[COMMENT_HEADING], matches[-1])
+
+        affected = set()
+        for fimp in self._file_importers:
+            if fimp._raw_rows is None:
+                affected.add(fimp._filepath)
+                continue
+
+            new_matches = []
+            for row, matches in zip(fimp._raw_rows, fimp._regex_matches):
+                new = sorted(
+                    [mapping[i] for i in matches if i in mapping]
+                    + [added[k] for k in added_engine.matches(row)]
+                )
+                if result(old_rules, matches) != result(new_rules, new):
+                    affected.add(fimp._filepath)
+                new_matches.append(new)
+
+            fimp._regex_matches = new_matches
+
+        return affected
+
+    def _finish_import(self):
+        for fimp, future in self._pending:
+            with stage(self._profile, "wait"):
+                packed, profile, stats = future.result()
+            fimp._set_packed(packed)
+            if profile is not None:
+                fimp.profile.add(profile)
+            if stats is not None:
+                self._regex_engine.stats.add(stats)
+            fimp._store_cached()
+
+        self._pending = []
+
+        if self._manifest:
+            with stage(self._profile, "manifest"):
+                self._manifest.prune()
+                self._manifest.save()
+
+        with stage(self._profile, "overlaps"):
+            self._index_overlaps()
+
+
+# lines listed per pair of files in overlap_warnings()
+OVERLAP_LINES_SHOWN = 10
+
+
+def overlap_key(record: Record) -> Tuple:
     """
-    Beware: Empty String in pattern matches everything, even without regex_cmp
+    Fingerabdruck einer Buchung aus Datum, Betrag, Empfänger, Zahler und
+    Verwendungszweck, Leerraum normalisiert. Gleich für dieselbe Buchung in
+    verschiedenen Exporten.
     """
+    return (
+        record.date,
+        record.value,
+        " ".join(record.receiver.split()),
+        " ".join(record.payer.split()),
+        " ".join(record.purpose.split()),
+    )
+
+
+class OverlapIndex:
+    """
+    Fingerabdrücke der Buchungen eines Kontos, Datei für Datei aufgebaut, um sich
+    überschneidende Auszüge (z.B. Monats- und Jahresexport) zu erkennen.
+
+    Steht ein Fingerabdruck in einer Datei n Mal und in einer früheren Datei
+    schon m Mal, sind die ersten min(n, m) Vorkommen Überschneidungen. Jede
+    Buchung zählt so oft, wie sie in einem einzelnen Auszug höchstens vorkommt.
+    """
+
+    def __init__(self):
+        # Fingerabdruck -> src refs der übernommenen Vorkommen
+        self._sources: Dict[Tuple, List[Tuple[int, int]]] = {}
+        # Textcode -> Code des Textes mit normalisiertem Leerraum
+        self._squashed: Dict[int, int] = {}
+        # (Überschneidung, früheres Vorkommen)
+        self.collisions: List[Tuple[Tuple[int, int], Tuple[int, int]]] = []
+
+    def add_file(self, records: List[Record]) -> List[int]:
+        """
+        Fügt die Einträge einer Datei hinzu, gibt die Positionen der
+        Überschneidungen zurück.
+        """
+        earlier: Dict[Tuple, int] = {}
+        seen: Counter = Counter()
+        overlapping = []
+        for i, record in enumerate(records):
+            key = self._key(record)
+            sources = self._sources.setdefault(key, [])
+            n = earlier.setdefault(key, len(sources))
+            occurrence = seen[key]
+            seen[key] += 1
+            if occurrence < n:
+                overlapping.append(i)
+                self.collisions.append((record.src_ref, sources[occurrence]))
+            else:
+                sources.append(record.src_ref)
+
+        return overlapping
+
+    def _key(self, record: Record) -> Tuple:
+        """overlap_key(), mit Textcodes statt Texten."""
+        return (
+            record.date,
+            record.value,
+            self._squash(record.catalog, record.receiver_id),
+            self._squash(record.catalog, record.payer_id),
+            self._squash(record.catalog, record.purpose_id),
+        )
+
+    def _squash(self, catalog: SourceCatalog, code: int) -> int:
+        squashed = self._squashed.get(code)
+        if squashed is None:
+            text = catalog.texts[code]
+            squashed = self._squashed[code] = catalog.text_id(" ".join(text.split()))
+
+        return squashed
 
-    def compare_strings(rule: str, text: str):
-        if regex_cmp:
-            return re.search(rule, text) is not None
-        else:
-            return rule == text
 
-    for i, rule in enumerate(rules):
-        comparisons = [
-            compare_strings(rule[field], adict[field])
-            for field in rule.keys()
-            if field not in [LABEL_HEADING, COMMENT_HEADING] and rule[field]
+# je Worker-Prozess die Importer der Konten mit ihren kompilierten Regeln
+_worker_importers: Dict[Tuple, "AccountImporter"] = {}
+
+
+def _worker_importer(
+    account: Account, profile: bool, rule_stats: bool
+) -> "AccountImporter":
+    """
+    Der Importer des Kontos in diesem Worker-Prozess. Die Regeln werden nur neu
+    gelesen und kompiliert, wenn sich die Regeldatei geändert hat.
+    """
+    rulesfilepath = account.srcpath.joinpath(RULES_SUBDIR, REGEX_RULE_FILENAME)
+    digest = None
+    if not account.labelled and rulesfilepath.exists():
+        digest = hashlib.sha1(rulesfilepath.read_bytes()).hexdigest()
+
+    key = (account.json(), digest, profile, rule_stats)
+    account_importer = _worker_importers.get(key)
+    if account_importer is None:
+        account_importer = AccountImporter(
+            account, use_cache=False, profile=profile, rule_stats=rule_stats
+        )
+        if not account.labelled:
+            account_importer._read_regex_rules()
+        _worker_importers[key] = account_importer
+
+    return account_importer
+
+
+def _import_file(
+    account: Account, filepath: Path, profile: bool = False, rule_stats: bool = False
+) -> Tuple[Tuple[Dict, List[str]], Optional[StageProfile], Optional["RuleStats"]]:
+    """
+    Importiert eine Datei in einem Worker-Prozess, die Einträge in kompakter Form,
+    mit profile die Zeiten der Stufen und mit rule_stats die Regeltreffer.
+    """
+    account_importer = _worker_importer(account, profile, rule_stats)
+    stats = None
+    if rule_stats and not account.labelled:
+        # Treffer nur dieser Datei, die Regeln bleiben für die nächste
+        stats = account_importer._regex_engine.collect_stats()
+
+    fimp = FileImporter(filepath, account_importer)
+    fimp._parse()
+    return (_pack_records(fimp.data()), fimp.import_errors), fimp.profile, stats
+
+
+def import_accounts(
+    accounts: List[Account],
+    use_cache: bool = True,
+    workers: int = 1,
+    profile: bool = False,
+    rule_stats: bool = False,
+) -> List[AccountImporter]:
+    """
+    Importiert mehrere Konten. Bei workers > 1 werden die Dateien aller Konten
+    gemeinsam auf einen Pool von Prozessen verteilt.
+    """
+    catalog = SourceCatalog()
+    importers = [
+        AccountImporter(
+            account,
+            use_cache=use_cache,
+            catalog=catalog,
+            profile=profile,
+            rule_stats=rule_stats,
+        )
+        for account in accounts
+    ]
+    if workers > 1:
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for imp in importers:
+                imp._start_import(executor)
+            for imp in importers:
+                imp._finish_import()
+    else:
+        for imp in importers:
+            imp.do_import()
+
+    return importers
+
+
+def _row_key(row: Dict) -> frozenset:
+    """Hashbarer Schlüssel, gleich für genau die Zeilen, die als Dict gleich sind."""
+    return frozenset(
+        (k, tuple(v) if isinstance(v, list) else v) for k, v in row.items()
+    )
+
+
+_REGEX_METACHARS = set(".^$*+?{}[]\\|()")
+# constructs that change meaning or fail when patterns are joined into one regex
+_UNCOMBINABLE_REGEX = re.compile(r"\\[1-9]|\(\?P[<=]|\(\?\(|\(\?[aiLmsux]+\)")
+
+
+def _is_literal(pattern: str) -> bool:
+    return not _REGEX_METACHARS.intersection(pattern)
+
+
+def _contains(literal: str):
+    return lambda text: literal in text
+
+
+def _required_literal(pattern: str) -> str:
+    """
+    Die längste Zeichenfolge, die in jedem Treffer von pattern vorkommen muss,
+    aus den Literalen auf oberster Ebene des Musters. Leer, wenn es keine gibt
+    (Alternativen, Wiederholungen, Groß-/Kleinschreibung egal).
+    """
+    if _is_literal(pattern):
+        return pattern
+
+    try:
+        parsed = sre_parse.parse(pattern)
+    except Exception:
+        return ""
+
+    if parsed.state.flags & re.IGNORECASE:
+        return ""
+
+    longest, run = "", []
+    for op, av in list(parsed) + [(None, None)]:
+        if op is sre_constants.LITERAL:
+            run.append(chr(av))
+            continue
+
+        if len(run) > len(longest):
+            longest = "".join(run)
+        run = []
+
+    return longest
+
+
+class _LiteralIndex:
+    """
+    Regeln eines Feldes nach einem Pflichtliteral. Jede Regel steht unter einem
+    Teilstring ihres Literals mit höchstens KEY_LENGTH Zeichen, gewählt aus
+    möglichst wenig belegten Schlüsseln. Für einen Text kommen nur die Regeln in
+    Frage, deren Schlüssel darin vorkommt, gefunden über die Teilstrings des
+    Textes statt über alle Regeln.
+    """
+
+    KEY_LENGTH = 4
+
+    def __init__(self):
+        self._rules: Dict[str, List[int]] = {}
+        # key length -> keys
+        self._keys: Dict[int, set] = {}
+
+    def add(self, literal: str, rule: int):
+        n = min(len(literal), self.KEY_LENGTH)
+        key = min(
+            (literal[j : j + n] for j in range(len(literal) - n + 1)),
+            key=lambda k: len(self._rules.get(k, ())),
+        )
+        self._rules.setdefault(key, []).append(rule)
+        self._keys.setdefault(n, set()).add(key)
+
+    def candidates(self, text: str) -> Iterator[int]:
+        for n, keys in self._keys.items():
+            grams = {text[j : j + n] for j in range(len(text) - n + 1)}
+            for key in grams & keys if len(grams) < len(keys) else keys & grams:
+                yield from self._rules[key]
+
+
+class RuleStats:
+    """
+    Treffer und Rechenzeit je Regel einer Regeldatei über alle geprüften Zeilen.
+
+    Mit overwrite entscheidet die letzte passende Regel über das Label. Eine
+    Regel, die passt, aber nie entscheidet, ist verdeckt (shadowed).
+    """
+
+    def __init__(self, nrules: int):
+        self.rows = 0
+        self.hits = [0] * nrules
+        self.decisive = [0] * nrules
+        self.seconds = [0.0] * nrules
+        self.prefilter_seconds = 0.0
+        # {shadowed rule: {deciding rule: rows}}
+        self.shadowed_by: Dict[int, Counter] = {}
+
+    def count(self, matches: List[int]):
+        self.rows += 1
+        for i in matches:
+            self.hits[i] += 1
+        if matches:
+            last = matches[-1]
+            self.decisive[last] += 1
+            for i in matches[:-1]:
+                self.shadowed_by.setdefault(i, Counter())[last] += 1
+
+    def add(self, other: "RuleStats"):
+        self.rows += other.rows
+        self.prefilter_seconds += other.prefilter_seconds
+        for i in range(len(self.hits)):
+            self.hits[i] += other.hits[i]
+            self.decisive[i] += other.decisive[i]
+            self.seconds[i] += other.seconds[i]
+        for i, by in other.shadowed_by.items():
+            self.shadowed_by.setdefault(i, Counter()).update(by)
+
+    def report(self, rules: List[Dict], rulespath: Path) -> Dict:
+        """Je Regel (Zeile in rulespath) Treffer, Zeit und Status."""
+        entries = []
+        for i, rule in enumerate(rules):
+            if not self.hits[i]:
+                status = "never"
+            elif not self.decisive[i]:
+                status = "shadowed"
+            else:
+                status = "ok"
+
+            entries.append(
+                {
+                    "line": i + 2,
+                    "label": rule[LABEL_HEADING],
+                    "comment": rule[COMMENT_HEADING],
+                    "patterns": {
+                        field: pattern
+                        for field, pattern in rule.items()
+                        if field not in [LABEL_HEADING, COMMENT_HEADING] and pattern
+                    },
+                    "hits": self.hits[i],
+                    "decisive": self.decisive[i],
+                    "seconds": round(self.seconds[i], 6),
+                    "shadowed_by": {
+                        j + 2: n for j, n in self.shadowed_by.get(i, Counter()).items()
+                    },
+                    "status": status,
+                }
+            )
+
+        by_cost = sorted(entries, key=lambda e: e["seconds"], reverse=True)
+        return {
+            "rulesfile": str(rulespath),
+            "rows": self.rows,
+            "prefilter_seconds": round(self.prefilter_seconds, 6),
+            "rules_seconds": round(sum(self.seconds), 6),
+            "never": [e["line"] for e in entries if e["status"] == "never"],
+            "shadowed": [e["line"] for e in entries if e["status"] == "shadowed"],
+            "most_expensive": [e["line"] for e in by_cost[:10] if e["seconds"] > 0],
+            "rules": entries,
+        }
+
+
+class RuleEngine:
+    """
+    Einmal kompilierte Regeln einer Regeldatei.
+
+    Ohne regex_cmp werden die Regeln über eine Hashtabelle ihrer Werte gefunden.
+    Regex-Muster werden vorkompiliert, Muster ohne Regex-Syntax als Teilstring
+    verglichen. Jede Regel mit einem Pflichtliteral (das Muster selbst oder die
+    längste feste Zeichenfolge eines Regex) steht in einem _LiteralIndex ihres
+    Feldes, eine Zeile wird nur gegen die Regeln geprüft, deren Literal dort
+    vorkommen kann. Die übrigen Regeln werden immer geprüft, ihre Muster eines
+    Feldes sind als Vorfilter zu einer Alternative zusammengefasst.
+
+    Mit stats (siehe RuleStats) werden Treffer und Rechenzeit je Regel gezählt,
+    das kostet eine Zeitmessung je geprüfter Regel und Zeile.
+
+    Beware: Empty String in pattern matches everything, even without regex_cmp
+    """
+
+    def __init__(self, rules: List[Dict], regex_cmp: bool, rulespath: Path):
+        self._rules = rules
+        self._rulespath = rulespath
+        self._sources = {}
+        self.stats: Optional[RuleStats] = None
+
+        # exact values: {fields: {values: [rule indices]}}
+        self._exact = {}
+        # remaining checks per rule: [(field, predicate)]
+        self._checks = {}
+        # rules without exact values or literal, candidates for every row
+        self._scanned = []
+        # {field: _LiteralIndex}
+        self._literals: Dict[str, _LiteralIndex] = {}
+
+        combinable = {}
+        for i, rule in enumerate(rules):
+            exact = []
+            checks = []
+            # (literal, field) of the longest required literal of the rule
+            anchor = ("", None)
+            regexes = []
+            for field, pattern in rule.items():
+                if field in [LABEL_HEADING, COMMENT_HEADING] or not pattern:
+                    continue
+
+                if not regex_cmp:
+                    exact.append((field, pattern))
+                    continue
+
+                if _is_literal(pattern):
+                    checks.append((field, _contains(pattern)))
+                else:
+                    try:
+                        regex = re.compile(pattern)
+                    except re.error as e:
+                        raise FimoException(
+                            f"Invalid pattern in {rulespath}:{i + 2}: {pattern} ({e})"
+                        )
+
+                    checks.append((field, regex.search))
+                    regexes.append((field, pattern))
+
+                literal = _required_literal(pattern)
+                if len(literal) > len(anchor[0]):
+                    anchor = (literal, field)
+
+            if exact:
+                fields = tuple(f for f, _ in exact)
+                values = tuple(v for _, v in exact)
+                self._exact.setdefault(fields, {}).setdefault(values, []).append(i)
+            elif anchor[1] is not None:
+                self._literals.setdefault(anchor[1], _LiteralIndex()).add(anchor[0], i)
+            else:
+                self._scanned.append(i)
+                for field, pattern in regexes:
+                    if not _UNCOMBINABLE_REGEX.search(pattern):
+                        combinable.setdefault(field, []).append((i, pattern))
+
+            self._checks[i] = checks
+
+        self._prefilters = []
+        for field, patterns in combinable.items():
+            if len(patterns) < 2:
+                continue
+
+            try:
+                combined = re.compile("|".join(f"(?:{p})" for _, p in patterns))
+            except re.error:
+                continue
+
+            self._prefilters.append((field, combined.search, {i for i, _ in patterns}))
+
+    def collect_stats(self) -> RuleStats:
+        self.stats = RuleStats(len(self._rules))
+        return self.stats
+
+    def _candidates(self, adict: Dict) -> List[int]:
+        excluded = set()
+        for field, search, indices in self._prefilters:
+            if search(adict[field]) is None:
+                excluded |= indices
+
+        candidates = [i for i in self._scanned if i not in excluded]
+        scanned = len(candidates)
+        for fields, index in self._exact.items():
+            candidates.extend(index.get(tuple(adict[f] for f in fields), []))
+        for field, index in self._literals.items():
+            candidates.extend(index.candidates(adict[field]))
+
+        if len(candidates) > scanned:
+            candidates.sort()
+
+        return candidates
+
+    def matches(self, adict: Dict) -> List[int]:
+        """Indizes der auf adict passenden Regeln in Dateireihenfolge."""
+        if self.stats is not None:
+            return self._counted_matches(adict)
+
+        return [
+            i
+            for i in self._candidates(adict)
+            if all(check(adict[field]) for field, check in self._checks[i])
         ]
-        if all(comparisons):
+
+    def _counted_matches(self, adict: Dict) -> List[int]:
+        stats = self.stats
+        t = time.perf_counter()
+        candidates = self._candidates(adict)
+        stats.prefilter_seconds += time.perf_counter() - t
+
+        matches = []
+        for i in candidates:
+            t = time.perf_counter()
+            matched = all(check(adict[field]) for field, check in self._checks[i])
+            stats.seconds[i] += time.perf_counter() - t
+            if matched:
+                matches.append(i)
+
+        stats.count(matches)
+        return matches
+
+    def _source(self, i: int) -> "RecordSource":
+        if i not in self._sources:
+            self._sources[i] = RecordSource(filepath=self._rulespath, linenumber=i + 2)
+
+        return self._sources[i]
+
+    def apply(self, adict: Dict, overwrite: bool):
+        self.apply_matches(adict, self.matches(adict), overwrite)
+
+    def apply_matches(self, adict: Dict, matches: List[int], overwrite: bool):
+        """Wendet die Regeln mit den Indizes matches (aus matches()) auf adict an."""
+        for i in matches:
+            rule = self._rules[i]
             if adict[LABEL_HEADING] and not overwrite:
                 adict[LABEL_HEADING] += "," + rule[LABEL_HEADING]
             else:
@@ -182,17 +1396,30 @@ def _apply_rules(
                 adict[COMMENT_HEADING] = rule[COMMENT_HEADING]
 
             if RULE_SRC in adict and adict[RULE_SRC] and not overwrite:
-                adict[RULE_SRC].append(
-                    RecordSource(filepath=rulespath, linenumber=i + 2)
-                )
+                adict[RULE_SRC].append(self._source(i))
             else:
-                adict[RULE_SRC] = [RecordSource(filepath=rulespath, linenumber=i + 2)]
+                adict[RULE_SRC] = [self._source(i)]
+
+
+def _apply_rules(
+    adict: Dict, rules: List[Dict], regex_cmp: bool, overwrite: bool, rulespath: Path
+):
+    """
+    Wendet rules auf adict an. Kompiliert die Regeln bei jedem Aufruf, für viele
+    Zeilen besser einmal eine RuleEngine erzeugen.
+    """
+    RuleEngine(rules, regex_cmp, rulespath).apply(adict, overwrite)
 
 
 class FileImporter:
     def __init__(self, filepath: Path, account_importer: AccountImporter):
         self._filepath = filepath
         self._account_importer = account_importer
+        # with keep_rows: the rows as read and the regex rules matching each row
+        self._raw_rows: Optional[List[Dict]] = None
+        self._regex_matches: Optional[List[List[int]]] = None
+        self.cached = False
+        self.profile = StageProfile() if account_importer._profile is not None else None
         if not self._account_importer._account.labelled:
             self._rulefilepath = self._filepath.parent.joinpath(
                 RULES_SUBDIR, self._filepath.name
@@ -202,102 +1429,261 @@ class FileImporter:
             )
 
     def do_import(self):
+        if not self._load_cached():
+            self._parse()
+            self._store_cached()
+
+    def _parse(self):
+        # an iterator for labelled accounts, a list if the rows are needed again
         rows = self._import()
-        self._data = self._normalize(rows)
+        try:
+            with stage(self.profile, "normalize"):
+                self._data = self._normalize(rows)
+        finally:
+            # bei einem Fehler mitten in einer gestreamten Datei wird sie geschlossen
+            if not isinstance(rows, list):
+                rows.close()
+        self._count("normalize", len(self._data))
 
         if not self._account_importer._account.labelled:
+            with stage(self.profile, "preview"):
+                self._write_preview_file(rows)
+
+        with stage(self.profile, "validate"):
+            self._validate()
+
+    def _count(self, name: str, rows: int):
+        if self.profile is not None:
+            self.profile.add_rows(name, rows)
+
+    def _relabel(self):
+        """
+        Beschriftet die behaltenen Zeilen neu, ohne die Datei erneut zu lesen. Von
+        den Einträgen ändern sich nur Labels, Kommentar und deren Quellen.
+        """
+        rows = self._label(self._raw_rows, self._regex_matches)
+        with stage(self.profile, "normalize"):
+            self._data = [
+                Record(
+                    r.catalog,
+                    r.account_id,
+                    r.date,
+                    r.value,
+                    r.receiver_id,
+                    r.payer_id,
+                    r.purpose_id,
+                    labels_id=r.catalog.split_id(row[LABEL_HEADING]),
+                    comment_id=r.catalog.split_id(row[COMMENT_HEADING]),
+                    src_ref=r.src_ref,
+                    preview_ref=r.preview_ref,
+                    labels_src_refs=self._labels_src_refs(row),
+                )
+                for r, row in zip(self._data, rows)
+            ]
+        self._count("normalize", len(self._data))
+        with stage(self.profile, "preview"):
             self._write_preview_file(rows)
+        with stage(self.profile, "validate"):
+            self._validate()
+
+    def _set_packed(self, packed: Tuple[Dict, List[str]]):
+        columns, self.import_errors = packed
+        account = self._account_importer._account
+        self._data = _unpack_records(
+            columns,
+            self._account_importer._catalog,
+            account,
+            self._filepath,
+            self._previewfilepath if not account.labelled else None,
+        )
 
-        self._validate(rows)
+    def _fingerprint(self):
+        """Alles, wovon die importierten Einträge dieser Datei abhängen."""
+        account = self._account_importer._account
+        manifest = self._account_importer._manifest
+        if account.labelled:
+            rules = None
+        else:
+            rules = (
+                manifest.digest(self._account_importer._regexrulesfilepath),
+                manifest.digest(self._rulefilepath),
+                file_stat(self._previewfilepath),
+            )
 
-    def data(self) -> List[AccountRecord]:
-        return self._data
+        return (
+            CACHE_VERSION,
+            str(self._filepath),
+            manifest.digest(self._filepath),
+            # skip_overlaps wirkt erst beim Zusammenführen, nicht beim Einlesen
+            account.json(exclude={"skip_overlaps"}),
+            rules,
+        )
 
-    def _get_row_value(self, row):
-        val_str = row[self._account_importer._account.heading_value].replace(".", "")
-        if re.match("-?[0-9]+,[0-9]$", val_str):
-            val_str = val_str.replace(",", "") + "0"
-        else:
-            val_str = val_str.replace(",", "") if "," in val_str else val_str + "00"
-        return int(val_str)
-
-    def _normalize(self, rows: List[Dict]) -> List[AccountRecord]:
-        result = [
-            AccountRecord(
-                account=self._account_importer._account,
-                spender=self._account_importer._account.spender,
-                date=datetime.datetime.strptime(
-                    row[self._account_importer._account.heading_date],
-                    self._account_importer._account.date_format,
-                ).date(),
-                value=self._get_row_value(row),
-                receiver=row.get(self._account_importer._account.heading_receiver, ""),
-                payer=row.get(self._account_importer._account.heading_payer, ""),
-                purpose=row.get(self._account_importer._account.heading_purpose, ""),
-                comment=row[COMMENT_HEADING].split(","),
-                labels=row[LABEL_HEADING].split(","),
-                src=RecordSource(
-                    filepath=self._filepath, linenumber=i + self._n_skipped_lines + 1
-                ),
-                preview_src=RecordSource(
-                    filepath=self._previewfilepath, linenumber=i + 2
+    def _fingerprint_digest(self) -> str:
+        return hashlib.sha1(repr(self._fingerprint()).encode("utf-8")).hexdigest()
+
+    def _load_cached(self) -> bool:
+        cache = self._account_importer._cache
+        if not cache:
+            return False
+
+        with stage(self.profile, "cache_load"):
+            payload = cache.load(self._filepath, self._fingerprint())
+            self.cached = payload is not None
+            if self.cached:
+                self._set_packed(payload)
+        if self.cached:
+            self._count("cache_load", len(self._data))
+
+        return self.cached
+
+    def _store_cached(self):
+        cache = self._account_importer._cache
+        if cache:
+            with stage(self.profile, "cache_store"):
+                cache.store(
+                    self._filepath,
+                    self._fingerprint(),
+                    (_pack_records(self._data), self.import_errors),
                 )
-                if not self._account_importer._account.labelled
-                else None,
-                labels_src=row[RULE_SRC] if RULE_SRC in row else [],
+
+    def data(self) -> List[Record]:
+        return self._data
+
+    def _parse_column(self, parse, texts: List[str], offset: int, *args):
+        try:
+            return parse(texts, *args)
+        except _ColumnError as e:
+            linenumber = offset + e.index + self._n_skipped_lines + 1
+            raise FimoException(
+                f"Could not parse '{e.text}' in {self._filepath}:{linenumber}"
             )
-            for i, row in enumerate(rows)
-        ]
 
-        for row in rows:
-            if RULE_SRC in row:
-                del row[RULE_SRC]
+    def _normalize(self, rows: Iterable[Dict]) -> List[Record]:
+        account = self._account_importer._account
+        catalog = self._account_importer._catalog
+        account_id = catalog.account_id(account)
+        src_id = catalog.file_id(self._filepath)
+        preview_id = (
+            catalog.file_id(self._previewfilepath) if not account.labelled else None
+        )
 
-        return result
+        records = []
+        rows = iter(rows)
+        while chunk := list(itertools.islice(rows, NORMALIZE_CHUNK_ROWS)):
+            offset = len(records)
+            dates = self._parse_column(
+                _parse_dates,
+                [row[account.heading_date] for row in chunk],
+                offset,
+                account.date_format,
+            )
+            values = self._parse_column(
+                _parse_amounts, [row[account.heading_value] for row in chunk], offset
+            )
 
-    def _import(self) -> List[Dict]:
-        with open(
-            self._filepath, "r", encoding=self._account_importer._account.csv_encoding
-        ) as f:
-            lines = f.readlines()
+            records.extend(
+                Record(
+                    catalog,
+                    account_id,
+                    date=dates[j],
+                    value=values[j],
+                    receiver_id=catalog.text_id(row.get(account.heading_receiver, "")),
+                    payer_id=catalog.text_id(row.get(account.heading_payer, "")),
+                    purpose_id=catalog.text_id(row.get(account.heading_purpose, "")),
+                    labels_id=catalog.split_id(row[LABEL_HEADING]),
+                    comment_id=catalog.split_id(row[COMMENT_HEADING]),
+                    src_ref=(src_id, offset + j + self._n_skipped_lines + 1),
+                    preview_ref=(preview_id, offset + j + 2)
+                    if preview_id is not None
+                    else None,
+                    labels_src_refs=self._labels_src_refs(row),
+                )
+                for j, row in enumerate(chunk)
+            )
 
-        self._n_skipped_lines = _remove_stuff_before_header(lines)
-        if _has_duplicates(lines):
-            raise FimoException(f"Found duplicates in file {self._filepath}")
+        return records
 
-        reader = csv.DictReader(
-            lines,
-            delimiter=self._account_importer._account.csv_delimiter,
-            quotechar='"',
+    def _labels_src_refs(self, row: Dict) -> Tuple[Tuple[int, int], ...]:
+        catalog = self._account_importer._catalog
+        return tuple(
+            (catalog.file_id(s.filepath), s.linenumber) for s in row.pop(RULE_SRC, [])
         )
-        self._fieldnames = reader.fieldnames
-
-        rows = [row for row in reader]
 
-        if not self._account_importer._account.labelled:
-            for r in rows:
+    def _read_rows(self) -> Iterator[Dict]:
+        with open(
+            self._filepath, "r", encoding=self._account_importer._account.csv_encoding
+        ) as f:
+            with stage(self.profile, "header"):
+                lines, self._n_skipped_lines = _lines_from_header(f)
+            reader = csv.DictReader(
+                _unique_lines(lines, self._filepath, self.profile),
+                delimiter=self._account_importer._account.csv_delimiter,
+                quotechar='"',
+            )
+            self._fieldnames = reader.fieldnames
+            yield from reader
+
+    def _import(self) -> Iterable[Dict]:
+        rows = self._read_rows()
+        labelled = self._account_importer._account.labelled
+        if labelled and self.profile is None:
+            return rows
+
+        # the rule file needs all rows, so they are kept in memory once; a profiled
+        # labelled file is read in full, so reading is not counted as normalizing
+        with stage(self.profile, "read"):
+            rows = list(rows)
+        self._count("read", len(rows))
+        if labelled:
+            return rows
+
+        with stage(self.profile, "regex_rules"):
+            regex_engine = self._account_importer._regex_engine
+            regex_matches = [regex_engine.matches(r) for r in rows]
+        if self._account_importer._keep_rows:
+            self._raw_rows = rows
+            self._regex_matches = regex_matches
+
+        return self._label(rows, regex_matches)
+
+    def _label(self, rows: List[Dict], regex_matches: List[List[int]]) -> List[Dict]:
+        regex_engine = self._account_importer._regex_engine
+        labelled_rows = []
+        with stage(self.profile, "regex_rules"):
+            for r, matches in zip(rows, regex_matches):
+                if self._raw_rows is not None:
+                    r = r.copy()
                 r[LABEL_HEADING] = ""
                 r[COMMENT_HEADING] = ""
-                _apply_rules(
-                    r,
-                    self._account_importer._regex_rules,
-                    True,
-                    True,
-                    self._account_importer._regexrulesfilepath,
-                )
+                regex_engine.apply_matches(r, matches, True)
+                labelled_rows.append(r)
+        self._count("regex_rules", len(rows))
 
+        nonregex_hits = 0
+        with stage(self.profile, "nonregex_rules"):
             nonregex_rules = self._create_or_update_nonregex_rule_file(
-                rows, reader.fieldnames
+                labelled_rows, self._fieldnames
             )
 
-            for r in rows:
-                _apply_rules(r, nonregex_rules, False, True, self._rulefilepath)
+            nonregex_engine = RuleEngine(nonregex_rules, False, self._rulefilepath)
+            for r in labelled_rows:
+                matches = nonregex_engine.matches(r)
+                nonregex_engine.apply_matches(r, matches, True)
+                nonregex_hits += bool(matches)
+        self._count("nonregex_rules", len(rows))
 
-        return rows
+        if self.profile is not None:
+            # rows labelled by at least one rule of the kind
+            self.profile.rule_hits["regex"] += sum(1 for m in regex_matches if m)
+            self.profile.rule_hits["nonregex"] += nonregex_hits
 
-    def _validate(self, rows):
+        return labelled_rows
+
+    def _validate(self):
         self.import_errors = []
-        if [r for r in rows if r[LABEL_HEADING] == ""]:
+        unlabeled = self._account_importer._catalog.split_id("")
+        if any(d.labels_id == unlabeled for d in self._data):
             self.import_errors.append(
                 f"There are unlabeled entries in file {self._rulefilepath}"
             )
@@ -306,33 +1692,44 @@ class FileImporter:
         try:
             nonregex_rules = []
             if self._rulefilepath.exists():
-                reader = CSVReader(self._rulefilepath, delimiter=";")
-                nonregex_rules = [row for row in reader]
+                with CSVReader(self._rulefilepath, delimiter=";") as reader:
+                    nonregex_rules = [row for row in reader]
 
             sortedfieldnames = self._account_importer._create_rule_file_fieldnames(
                 fieldnames
             )
 
-            with open(self._rulefilepath, "w") as f:
-                writer = csv.DictWriter(
-                    f, fieldnames=sortedfieldnames, delimiter=";", quoting=csv.QUOTE_ALL
-                )
-                writer.writeheader()
+            f = io.StringIO()
+            writer = csv.DictWriter(
+                f, fieldnames=sortedfieldnames, delimiter=";", quoting=csv.QUOTE_ALL
+            )
+            writer.writeheader()
+
+            # each labelled rule replaces one identical unlabelled src row
+            replaced = Counter()
+            for row in nonregex_rules:
+                if row[LABEL_HEADING] or row[COMMENT_HEADING]:
+                    writer.writerow(row)
+
+                    orig_row = row.copy()
+                    orig_row[LABEL_HEADING] = ""
+                    orig_row[COMMENT_HEADING] = ""
+                    replaced[_row_key(orig_row)] += 1
 
-                rows_remaining = rows.copy()
-                for row in nonregex_rules:
-                    if row[LABEL_HEADING] or row[COMMENT_HEADING]:
-                        writer.writerow(row)
+            for row in rows:
+                if row[LABEL_HEADING] or row[COMMENT_HEADING]:
+                    continue
+
+                # rows touched by a regex rule never equal a rule file row
+                if RULE_SRC not in row:
+                    key = _row_key(row)
+                    if replaced[key]:
+                        replaced[key] -= 1
+                        continue
 
-                        orig_row = row.copy()
-                        orig_row[LABEL_HEADING] = ""
-                        orig_row[COMMENT_HEADING] = ""
-                        if orig_row in rows_remaining:
-                            rows_remaining.remove(orig_row)
+                writer.writerow(row)
 
-                for row in rows_remaining:
-                    if not row[LABEL_HEADING] and not row[COMMENT_HEADING]:
-                        writer.writerow(row)
+            _write_if_changed(self._rulefilepath, f.getvalue())
 
             return nonregex_rules
 
@@ -344,22 +1741,65 @@ class FileImporter:
             self._fieldnames
         )
 
-        with open(self._previewfilepath, "w") as f:
-            writer = csv.DictWriter(
-                f, fieldnames=sortedfieldnames, delimiter=";", quoting=csv.QUOTE_ALL
-            )
-            writer.writeheader()
+        f = io.StringIO()
+        writer = csv.DictWriter(
+            f, fieldnames=sortedfieldnames, delimiter=";", quoting=csv.QUOTE_ALL
+        )
+        writer.writeheader()
+
+        for row in rows:
+            if row[LABEL_HEADING]:
+                writer.writerow(row)
+
+        _write_if_changed(self._previewfilepath, f.getvalue())
 
-            for row in rows:
-                if row[LABEL_HEADING]:
-                    writer.writerow(row)
+
+def _write_if_changed(filepath: Path, text: str):
+    """
+    Schreibt text nach filepath, aber nur, wenn sich der Inhalt ändert. So bleibt
+    die mtime unveränderter Dateien erhalten und ein Watcher sieht nur echte
+    Änderungen.
+    """
+    try:
+        with open(filepath, "r", newline="") as f:
+            if f.read() == text:
+                return
+    except (OSError, UnicodeDecodeError):
+        pass
+
+    with open(filepath, "w", newline="") as f:
+        f.write(text)
 
 
 class CSVReader(csv.DictReader):
-    def __init__(self, filepath: Path, delimiter: str, encoding=None):
-        with open(filepath, "r", encoding=encoding) as f:
-            lines = f.readlines()
+    """
+    Liest die Datei zeilenweise. Sie wird geschlossen, sobald alle Zeilen gelesen
+    sind oder das Lesen fehlschlägt, sonst am Ende des with Blocks.
+    """
 
-        _remove_stuff_before_header(lines)
+    def __init__(self, filepath: Path, delimiter: str, encoding=None):
+        self._file = open(filepath, "r", encoding=encoding)
+        try:
+            lines, _ = _lines_from_header(self._file)
+        except BaseException:
+            self._file.close()
+            raise
 
         super().__init__(lines, delimiter=delimiter, quotechar='"')
+
+    def __enter__(self) -> "CSVReader":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._file.close()
+
+    def __next__(self):
+        try:
+            return super().__next__()
+        except BaseException:
+            # StopIteration am Ende der Datei oder ein Fehler beim Lesen
+            self._file.close()
+            raise
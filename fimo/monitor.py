@@ -1,17 +1,17 @@
 from datetime import date, timedelta
 from enum import Enum
+from pathlib import Path
 from typing import Dict, List, Optional, Tuple
 
-import matplotlib
-import matplotlib.pyplot as plt
 import numpy
-from dateutil import rrule
 from pydantic import BaseModel
 
-from fimo import importer
+from fimo import importer, render
+from fimo.cache import QueryCache
+from fimo.sqlstore import SQLiteStore
+from fimo.store import LabelStats, RecordStore
 
 SKIP_LABEL = "SKIP"
-FIGSIZE = [16, 9]
 
 PREFIXES = {"Martin": "L", "Liane": "M"}
 
@@ -28,6 +28,38 @@ def org_verbatim(text):
     return f"={text}="
 
 
+class Period(Enum):
+    WEEKLY = 0
+    MONTHLY = 1
+    QUARTERLY = 2
+    YEARLY = 3
+
+
+# rrule Frequenz, Intervall und Format der Achsenbeschriftung je Periode
+_PERIOD_RULES = {
+    Period.WEEKLY: ("WEEKLY", 1, "%Y-%m-%d"),
+    Period.MONTHLY: ("MONTHLY", 1, "%Y-%m"),
+    Period.QUARTERLY: ("MONTHLY", 3, "%Y-%m"),
+    Period.YEARLY: ("YEARLY", 1, "%Y"),
+}
+
+
+def _period_steps(startdate: date, enddate: date, period: Period) -> List[date]:
+    from dateutil import rrule
+
+    freq, interval, _ = _PERIOD_RULES[period]
+    stepdays = list(
+        rrule.rrule(
+            getattr(rrule, freq), dtstart=startdate, until=enddate, interval=interval
+        )
+    )
+
+    if len(stepdays) < 1:
+        raise Exception(f"Date range must be at least one {period.name.lower()} step")
+
+    return [s.date() for s in stepdays]
+
+
 class SortField(Enum):
     SPENDER = 0
     DATE = 1
@@ -48,11 +80,11 @@ def _truncate_string(str_input: str, max_length: Optional[int]):
 
 
 def sort_records(
-    data: List[importer.AccountRecord],
+    data: List[importer.Record],
     field: Optional[SortField] = None,
     reverse: bool = False,
 ):
-    def keyf(x: importer.AccountRecord):
+    def keyf(x: importer.Record):
         if field == SortField.SPENDER:
             result = x.spender
         elif field == SortField.DATE:
@@ -79,7 +111,7 @@ def sort_records(
 
 
 def org_print(
-    data: List[importer.AccountRecord],
+    data: List[importer.Record],
     truncate: Optional[int] = 50,
     invert: bool = False,
     with_src_links: bool = True,
@@ -144,44 +176,194 @@ class RecordQuery(BaseModel):
     plotlabel: Optional[str]
 
 
+def _query_key(
+    labels: Optional[List[str]] = None,
+    exclude_labels: Optional[List[str]] = None,
+    spender: Optional[str] = None,
+    startdate: Optional[date] = None,
+    enddate: Optional[date] = None,
+    value: float | None = None,
+    invert: bool = False,
+) -> Tuple:
+    """Schlüssel, gleich für Abfragen, die dieselben Einträge auswählen."""
+    return (
+        frozenset(labels) if labels else None,
+        frozenset(exclude_labels) if exclude_labels else None,
+        spender,
+        startdate,
+        enddate,
+        abs(round(value * 100)) if value else None,
+        bool(invert),
+    )
+
+
+def _query_filter(query: RecordQuery) -> Dict:
+    """
+    Filter für die query_* Methoden der Stores. RecordQuery.value bleibt wie in
+    sum_query unberücksichtigt.
+    """
+    return dict(
+        labels=query.labels,
+        spender=query.spender,
+        startdate=query.startdate,
+        enddate=query.enddate,
+    )
+
+
 class Monitor:
-    def __init__(self, accounts: List[importer.Account]):
+    def __init__(
+        self,
+        accounts: List[importer.Account],
+        use_cache: bool = True,
+        workers: int = 1,
+        query_cache_size: int = 1024,
+        database: Optional[Path] = None,
+    ):
+        """
+        Mit database liegen die Einträge in dieser SQLite Datei statt im
+        Speicher, übertragen werden nur geänderte Kontoauszüge.
+        """
+        self._accounts = accounts
+        self._use_cache = use_cache
+        self._workers = workers
+        self._database = database
+        self._store = None
         self._importers = []
-        for account in accounts:
-            imp = importer.AccountImporter(account)
-            self._importers.append(imp)
-            imp.do_import()
+        self._results = QueryCache(query_cache_size)
+        self.reload()
+
+    def reload(self) -> bool:
+        """
+        Importiert alle Konten erneut, unveränderte Dateien kommen aus dem Cache.
+        Haben sich Dateien geändert, werden die Daten ersetzt und die gespeicherten
+        Abfrageergebnisse verworfen.
+        """
+        if self._database is not None:
+            return self._sync_database()
+
+        importers = importer.import_accounts(
+            self._accounts, use_cache=self._use_cache, workers=self._workers
+        )
+        for imp in importers:
             if imp.import_errors():
                 print(f"Warning: {imp.import_errors()[0]}")
+            # skipped overlaps were asked for, the others distort the sums
+            if imp.overlap_warnings() and not imp._account.skip_overlaps:
+                print(f"Warning: {imp.overlap_warnings()[0]}")
+
+        changed = (
+            not self._importers
+            or any(imp.reimported_files() for imp in importers)
+            or [imp.files() for imp in importers]
+            != [imp.files() for imp in self._importers]
+        )
+        self._importers = importers
+        if changed:
+            data = []
+            for imp in importers:
+                data.extend(imp.data())
 
-    def data(self) -> List["AccountRecord"]:
-        data = []
-        for imp in self._importers:
-            data.extend(imp.data())
+            self._store = RecordStore(data)
+            self._results.clear()
 
-        return data
+        return changed
+
+    def _sync_database(self) -> bool:
+        first = self._store is None
+        if first:
+            self._store = SQLiteStore(self._database)
+
+        changed = bool(self._store.sync(self._accounts, use_cache=self._use_cache))
+        errors = self._store.import_errors()
+        if errors and (first or changed):
+            print(f"Warning: {errors[0]}")
+
+        if first or changed:
+            self._results.clear()
+
+        return first or changed
+
+    def query_cache_stats(self) -> Dict[str, int]:
+        return self._results.stats()
+
+    def data(self) -> List[importer.AccountRecord]:
+        return [r.to_model() for r in self._store.query_records([{}])[0]]
 
     def labels_in_use(self, query: RecordQuery) -> List[str]:
-        labels = []
-        for d in self.catlist(
-            labels=query.labels,
-            spender=query.spender,
-            startdate=query.startdate,
-            enddate=query.enddate,
-        ):
-            labels.extend(d.labels)
+        def compute():
+            return self._store.query_labels_in_use(_query_filter(query))
 
-        return labels
+        key = _query_key(
+            query.labels, None, query.spender, query.startdate, query.enddate
+        )
+        return list(self._results.get(("labels_in_use",) + key, compute))
 
-    def org_labels(self, query: RecordQuery) -> List[List[str]]:
-        labels = self.labels_in_use(query)
+    def label_stats(self, query: RecordQuery) -> LabelStats:
+        """Kennzahlen der Labels aller Einträge, die query auswählt."""
+
+        def compute():
+            return self._store.query_label_stats(_query_filter(query))
+
+        key = _query_key(
+            query.labels, None, query.spender, query.startdate, query.enddate
+        )
+        return self._results.get(("label_stats",) + key, compute)
 
-        labels_count = []
-        for l in list(set(labels)):
-            (labels_count.append((org_verbatim(l), labels.count(l))))
+    def label_cooccurrence(self, query: RecordQuery) -> Dict[str, Dict[str, int]]:
+        """Je Label die Labels, die mit ihm an Einträgen aus query stehen."""
+
+        def compute():
+            return self._store.query_label_cooccurrence(_query_filter(query))
+
+        key = _query_key(
+            query.labels, None, query.spender, query.startdate, query.enddate
+        )
+        return self._results.get(("label_cooccurrence",) + key, compute)
+
+    def org_labels(self, query: RecordQuery) -> List[List[str]]:
+        stats = self.label_stats(query)
 
+        labels_count = [
+            (org_verbatim(l), int(c)) for l, c in zip(stats.labels, stats.counts)
+        ]
         return sorted(labels_count, key=lambda x: x[1])
 
+    def org_labelstats(self, query: RecordQuery) -> List[List[str]]:
+        stats = self.label_stats(query)
+        cooccurrence = self.label_cooccurrence(query)
+        # bei gleicher Häufigkeit in der Reihenfolge der Labels
+        position = {l: i for i, l in enumerate(stats.labels)}
+
+        out = [
+            [
+                "*Label*",
+                "*Anzahl*",
+                "*Summe*",
+                "*Erster*",
+                "*Letzter*",
+                "*Häufig mit*",
+            ],
+            None,
+        ]
+        for i in numpy.argsort(-stats.counts, kind="stable"):
+            label = stats.labels[i]
+            partners = sorted(
+                cooccurrence.get(label, {}).items(),
+                key=lambda p: (-p[1], position[p[0]]),
+            )
+            out.append(
+                [
+                    org_verbatim(label),
+                    int(stats.counts[i]),
+                    (1 - 2 * int(query.invert)) * int(stats.totals[i]) / 100,
+                    str(stats.first[i]),
+                    str(stats.last[i]),
+                    ", ".join(org_verbatim(l) for l, _ in partners[:3]),
+                ]
+            )
+
+        return out
+
     def org_list(
         self,
         query: RecordQuery,
@@ -190,7 +372,7 @@ class Monitor:
         sort_reverse: bool = False,
         with_src_links: bool = True,
     ) -> List[List[str]]:
-        data = self.catlist(
+        data = self._catlist(
             labels=query.labels,
             spender=query.spender,
             startdate=query.startdate,
@@ -204,130 +386,57 @@ class Monitor:
             with_src_links=with_src_links,
         )
 
-    def org_monthlycatsumplot(self, queries: List[RecordQuery], filename: str) -> str:
-        fig, ax = plt.subplots()
-        bottom_dict = {}
-
-        for i, query in enumerate(queries):
-            dates, sums = self.monthlycatsumplotdata(
-                query.labels,
-                query.spender,
-                query.startdate,
-                query.enddate,
-                invert=query.invert,
-            )
-
-            bottom = []
-            for d in dates:
-                if d in bottom_dict:
-                    bottom.append(bottom_dict[d])
-                else:
-                    bottom.append(0)
-
-            ax.bar(
-                dates,
-                sums,
-                bottom=bottom,
-                label=query.plotlabel if query.plotlabel else f"{i}",
+    def monthlycatsumplot_job(
+        self,
+        queries: List[RecordQuery],
+        filename: str,
+        period: Period = Period.MONTHLY,
+    ) -> render.PlotJob:
+        series = [
+            (query.plotlabel if query.plotlabel else f"{i}", dates, sums)
+            for i, (query, (dates, sums)) in enumerate(
+                zip(queries, self.periodsums(queries, period=period))
             )
+        ]
+        return render.PlotJob("periodbars", filename, series)
 
-            for d, s in zip(dates, sums):
-                if d in bottom_dict:
-                    bottom_dict[d] += s
-                else:
-                    bottom_dict[d] = s
-
-            bottom += numpy.array(sums)
-
-        ax.legend()
-        fig.set_size_inches(FIGSIZE)
-        fig.tight_layout()
-        plt.savefig(filename)
-        return filename
-
-    def org_catsumsplot(self, queries: List[RecordQuery], filename: str):
-        fig, ax = plt.subplots()
+    def catsumsplot_job(
+        self, queries: List[RecordQuery], filename: str
+    ) -> render.PlotJob:
         sums = []
         sums_total = []
         labels = []
+        prefixed_queries = []
         for query in queries:
-            c_sum = numpy.max(
-                (
-                    0,
-                    self.sum_query(query),
+            prefixed_queries.append(query)
+            for spender in ["Martin", "Liane"]:
+                prefixed_queries.append(
+                    query.copy(
+                        update=dict(
+                            labels=[prefix_label(l, spender) for l in query.labels]
+                        )
+                    )
                 )
-            )
-            sums.append(c_sum)
-            labels.append(", ".join(query.labels) if c_sum else "")
-
-            l_labels = [prefix_label(l, "Martin") for l in query.labels]
-            l_sum = numpy.max(
-                (
-                    0,
-                    self.sum(
-                        labels=l_labels,
-                        spender=query.spender,
-                        startdate=query.startdate,
-                        enddate=query.enddate,
-                        invert=query.invert,
-                    ),
-                )
-            )
-            sums.append(l_sum)
-            labels.append(", ".join(l_labels) if l_sum else "")
-
-            m_labels = [prefix_label(l, "Liane") for l in query.labels]
-            m_sum = numpy.max(
-                (
-                    0,
-                    self.sum(
-                        labels=m_labels,
-                        spender=query.spender,
-                        startdate=query.startdate,
-                        enddate=query.enddate,
-                        invert=query.invert,
-                    ),
-                )
-            )
-            sums.append(m_sum)
-            labels.append(", ".join(m_labels) if m_sum else "")
-
-            sums_total.append(c_sum + l_sum + m_sum)
 
-        inner_steps = numpy.arange(5) * 4
-        outer_steps = [i for i in numpy.arange(20) if not i % 4 == 0]
-        cmap1 = plt.colormaps["tab20b"]
-        cmap2 = plt.colormaps["tab20c"]
-        inner_colors = numpy.concatenate((cmap1(inner_steps), cmap2(inner_steps)))
-        outer_colors = numpy.concatenate((cmap1(outer_steps), cmap2(outer_steps)))
-
-        sumsum = numpy.sum(sums)
-
-        ax.pie(
-            sums,
-            labels=labels,
-            # autopct=lambda pct: f"{(pct / 100 * sumsum):,.2f} €",
-            radius=0.8,
-            wedgeprops=dict(width=0.3, edgecolor="w"),
-            colors=outer_colors,
-        )
-        ax.pie(
-            sums_total,
-            autopct=lambda pct: f"{(pct / 100 * sumsum):,.2f} €",
-            radius=0.5,
-            wedgeprops=dict(width=0.3, edgecolor="w"),
-            colors=inner_colors,
-        )
-        ax.axis("equal")
-        # ax.set_title(f"Total {sumsum:,.2f} €")
-
-        fig.set_size_inches(FIGSIZE)
-        fig.tight_layout()
-        plt.savefig(filename)
-        return filename
-
-    def org_catsumplot(self, queries: List[RecordQuery], filename: str):
-        fig, ax = plt.subplots()
+        prefixed_sums = self.evaluate_many(prefixed_queries)
+        for i in range(len(queries)):
+            group_sums = []
+            for query, q_sum in zip(
+                prefixed_queries[3 * i : 3 * i + 3], prefixed_sums[3 * i : 3 * i + 3]
+            ):
+                c_sum = max(0, q_sum)
+                sums.append(c_sum)
+                labels.append(", ".join(query.labels) if c_sum else "")
+                group_sums.append(c_sum)
+
+            sums_total.append(sum(group_sums))
+
+        return render.PlotJob("catsums", filename, (sums, labels, sums_total))
+
+    def catsumplot_job(
+        self, queries: List[RecordQuery], filename: str
+    ) -> render.PlotJob:
+        series = []
         for i, query in enumerate(queries):
             dates, sums = self.catsumplotdata(
                 query.labels,
@@ -336,42 +445,47 @@ class Monitor:
                 query.enddate,
                 invert=query.invert,
             )
-            ax.step(
-                dates,
-                sums,
-                label=query.plotlabel if query.plotlabel else f"{i}",
-                where="post",
-            )
+            series.append((query.plotlabel if query.plotlabel else f"{i}", dates, sums))
 
-        ax.legend()
-        fig.set_size_inches(FIGSIZE)
-        fig.tight_layout()
-        plt.savefig(filename)
-        return filename
+        return render.PlotJob("catsum", filename, series)
 
-    def org_catplot(self, queries: List[RecordQuery], filename: str):
-        fig, ax = plt.subplots()
+    def catplot_job(self, queries: List[RecordQuery], filename: str) -> render.PlotJob:
+        series = []
         for i, query in enumerate(queries):
-            dates, sums, labels = self.catplotdata(
+            dates, sums, _ = self.catplotdata(
                 query.labels,
                 query.spender,
                 query.startdate,
                 query.enddate,
                 invert=query.invert,
             )
-            if dates:
-                ax.stem(
-                    dates,
-                    sums,
-                    label=query.plotlabel if query.plotlabel else f"{i}",
-                    markerfmt=["o", "P", "X", "v", "^"][i],
-                )
+            series.append((query.plotlabel if query.plotlabel else f"{i}", dates, sums))
+
+        return render.PlotJob("cat", filename, series)
 
-        ax.legend()
-        fig.set_size_inches(FIGSIZE)
-        fig.tight_layout()
-        plt.savefig(filename)
-        return filename
+    def org_monthlycatsumplot(
+        self,
+        queries: List[RecordQuery],
+        filename: str,
+        period: Period = Period.MONTHLY,
+    ) -> str:
+        return render.render(self.monthlycatsumplot_job(queries, filename, period))
+
+    def org_catsumsplot(self, queries: List[RecordQuery], filename: str):
+        return render.render(self.catsumsplot_job(queries, filename))
+
+    def org_catsumplot(self, queries: List[RecordQuery], filename: str):
+        return render.render(self.catsumplot_job(queries, filename))
+
+    def org_catplot(self, queries: List[RecordQuery], filename: str):
+        return render.render(self.catplot_job(queries, filename))
+
+    def org_plots(self, jobs: List[render.PlotJob], workers: int = 1) -> List[str]:
+        """
+        Zeichnet viele Plots auf einmal, z.B. für einen Bericht. Die Jobs kommen aus
+        den *_job Methoden, bei workers > 1 wird in mehreren Prozessen gezeichnet.
+        """
+        return render.render_many(jobs, workers=workers)
 
     def catlist(
         self,
@@ -382,24 +496,37 @@ class Monitor:
         enddate: date = date(2050, 1, 31),
         value: float | None = None,
     ) -> List[importer.AccountRecord]:
-        def check_spender(d: importer.AccountRecord):
-            return spender is None or d.spender == spender
-
-        catdata = [
-            d
-            for d in self.data()
-            if (not labels or set(labels).intersection(d.labels))
-            and (not exclude_labels or not set(exclude_labels).intersection(d.labels))
-            and check_spender(d)
-            and d.date >= startdate
-            and d.date < enddate
-            and (
-                not value
-                or d.value == round(value * 100)
-                or d.value == -round(value * 100)
+        return [
+            r.to_model()
+            for r in self._catlist(
+                labels, exclude_labels, spender, startdate, enddate, value
             )
         ]
-        return catdata
+
+    def _catlist(
+        self,
+        labels: Optional[List[str]] = None,
+        exclude_labels: Optional[List[str]] = None,
+        spender: Optional[str] = None,
+        startdate: date = date(2000, 1, 31),
+        enddate: date = date(2050, 1, 31),
+        value: float | None = None,
+    ) -> List[importer.Record]:
+        """Wie catlist(), aber die Einträge selbst, ohne Umwandlung in Modelle."""
+
+        def compute():
+            f = dict(
+                labels=labels,
+                exclude_labels=exclude_labels,
+                spender=spender,
+                startdate=startdate,
+                enddate=enddate,
+                value=value,
+            )
+            return self._store.query_records([f])[0]
+
+        key = _query_key(labels, exclude_labels, spender, startdate, enddate, value)
+        return list(self._results.get(("catlist",) + key, compute))
 
     def sum(
         self,
@@ -412,15 +539,46 @@ class Monitor:
         invert: bool = False,
     ) -> float:
         """Summiert alle Einträge mit den gewünschten Labels."""
-        catdata = self.catlist(
-            labels=labels,
-            exclude_labels=exclude_labels,
-            spender=spender,
-            startdate=startdate,
-            enddate=enddate,
-            value=value,
+
+        def compute():
+            f = dict(
+                labels=labels,
+                exclude_labels=exclude_labels,
+                spender=spender,
+                startdate=startdate,
+                enddate=enddate,
+                value=value,
+            )
+            return (1 - 2 * int(invert)) * self._store.query_totals([f])[0] / 100
+
+        key = _query_key(
+            labels, exclude_labels, spender, startdate, enddate, value, invert
         )
-        return (1 - 2 * int(invert)) * sum([d.value for d in catdata]) / 100
+        return self._results.get(("sum",) + key, compute)
+
+    def catlist_many(
+        self, queries: List[RecordQuery]
+    ) -> List[List[importer.AccountRecord]]:
+        return [
+            [r.to_model() for r in records]
+            for records in self._store.query_records(
+                [_query_filter(q) for q in queries]
+            )
+        ]
+
+    def evaluate_many(self, queries: List[RecordQuery]) -> List[float]:
+        """
+        Summen für mehrere Queries in einem Durchlauf.
+
+        Wie sum_query ohne RecordQuery.value. Im Speicher kommen die Summen aus
+        dem Index der Präfixsummen, mit Datenbank wird jede Query zu einer SQL
+        Summe.
+        """
+        totals = self._store.query_totals([_query_filter(q) for q in queries])
+        return [
+            (1 - 2 * int(query.invert)) * int(total) / 100
+            for query, total in zip(queries, totals)
+        ]
 
     def sum_query(self, query: RecordQuery) -> float:
         return self.sum(
@@ -435,18 +593,22 @@ class Monitor:
         """
         Persönliche Bilanz für query.spender. Es werden alle Kategorien in query.labels aus gemeinsamer und persönlicher Sicht betrachtet.
         """
-        # Gemeinsame Ausgaben
-        common_expenses = self.sum(
-            labels=query.labels,
-            startdate=query.startdate,
-            enddate=query.enddate,
-        )
-
         priv_labels = [prefix_label(l, query.spender) for l in query.labels]
-        priv_expenses = self.sum(
-            labels=priv_labels,
-            startdate=query.startdate,
-            enddate=query.enddate,
+
+        # Gemeinsame und persönliche Ausgaben
+        common_expenses, priv_expenses = self.evaluate_many(
+            [
+                RecordQuery(
+                    labels=query.labels,
+                    startdate=query.startdate,
+                    enddate=query.enddate,
+                ),
+                RecordQuery(
+                    labels=priv_labels,
+                    startdate=query.startdate,
+                    enddate=query.enddate,
+                ),
+            ]
         )
 
         sum = common_expenses / 2 + priv_expenses
@@ -483,20 +645,16 @@ class Monitor:
             startdate=startdate,
             enddate=enddate,
         )
-        real_balance_m = self.sum_query(real_balance_m_query)
         private_balance_m_query = RecordQuery(
             labels=[f"{prefix_label(l, spender)}" for l in compensated_labels],
             startdate=startdate,
             enddate=enddate,
         )
-        private_balance_m = self.sum_query(private_balance_m_query)
         common_balance_query = RecordQuery(
             labels=compensated_labels,
             startdate=startdate,
             enddate=enddate,
         )
-        common_balance = self.sum_query(common_balance_query)
-        fair_balance_m = private_balance_m + common_balance / 2
         transfer_m_query = RecordQuery(
             labels=transfer_labels
             + [f"{prefix_label(l, spender)}" for l in transfer_labels]
@@ -506,24 +664,58 @@ class Monitor:
             enddate=enddate,
             invert=True,
         )
-        transfer_m = self.sum_query(transfer_m_query)
+        (
+            real_balance_m,
+            private_balance_m,
+            common_balance,
+            transfer_m,
+        ) = self.evaluate_many(
+            [
+                real_balance_m_query,
+                private_balance_m_query,
+                common_balance_query,
+                transfer_m_query,
+            ]
+        )
+        fair_balance_m = private_balance_m + common_balance / 2
         compensation_m = fair_balance_m - real_balance_m + transfer_m
         return compensation_m
 
     def org_monthlycatsum_list(
-        self, queries: List[RecordQuery]
+        self, queries: List[RecordQuery], period: Period = Period.MONTHLY
     ) -> List[List[Tuple[str, float]]]:
-        results = []
-        for query in queries:
-            dates, sums = self.monthlycatsumplotdata(
-                query.labels,
-                query.spender,
-                query.startdate,
-                query.enddate,
-                invert=query.invert,
-            )
+        return [
+            list(zip(dates, sums))
+            for dates, sums in self.periodsums(queries, period=period)
+        ]
+
+    def periodsums(
+        self, queries: List[RecordQuery], period: Period = Period.MONTHLY
+    ) -> List[Tuple[List[str], List[float]]]:
+        """
+        Summen je Periode für mehrere Queries.
 
-            results.append(list(zip(dates, sums)))
+        Der Store summiert je Query über alle Perioden eines Zeitraums auf
+        einmal, Queries mit gleichem Zeitraum teilen sich die Periodengrenzen.
+        """
+        fmt = _PERIOD_RULES[period][2]
+        ranges = {}
+        for i, query in enumerate(queries):
+            ranges.setdefault((query.startdate, query.enddate), []).append(i)
+
+        results = [None] * len(queries)
+        for (startdate, enddate), indices in ranges.items():
+            stepdays = _period_steps(startdate, enddate, period)
+            totals = [
+                self._store.query_binned_totals(
+                    stepdays, dict(labels=queries[i].labels, spender=queries[i].spender)
+                )
+                for i in indices
+            ]
+            plotdays = [(s - timedelta(days=1)).strftime(fmt) for s in stepdays[1:]]
+            for i, cents in zip(indices, totals):
+                sign = 1 - 2 * int(queries[i].invert)
+                results[i] = (list(plotdays), [sign * int(c) / 100 for c in cents])
 
         return results
 
@@ -534,27 +726,21 @@ class Monitor:
         startdate: date = date(2000, 1, 31),
         enddate: date = date(2050, 1, 31),
         invert: bool = False,
-    ) -> Tuple[List[date], List[float]]:
-        stepdays = list(rrule.rrule(rrule.MONTHLY, dtstart=startdate, until=enddate))
-
-        if len(stepdays) < 1:
-            raise Exception("Date range must be at least one month")
-
-        catsums = []
-        plotdays = []
-        for i in range(len(stepdays) - 1):
-            catdata = self.catlist(
-                labels=labels,
-                spender=spender,
-                startdate=stepdays[i].date(),
-                enddate=stepdays[i + 1].date(),
-            )
-            catsums.append(
-                (1 - 2 * int(invert)) * sum([d.value for d in catdata]) / 100
-            )
-            plotdays.append((stepdays[i + 1] - timedelta(days=1)).strftime("%Y-%m"))
-
-        return plotdays, catsums
+        period: Period = Period.MONTHLY,
+    ) -> Tuple[List[str], List[float]]:
+        query = RecordQuery(
+            labels=labels,
+            spender=spender,
+            startdate=startdate,
+            enddate=enddate,
+            invert=invert,
+        )
+        key = _query_key(labels, None, spender, startdate, enddate, None, invert)
+        dates, sums = self._results.get(
+            ("periodsums", period) + key,
+            lambda: self.periodsums([query], period=period)[0],
+        )
+        return list(dates), list(sums)
 
     def catsumplotdata(
         self,
@@ -564,19 +750,20 @@ class Monitor:
         enddate: date = date(2050, 1, 31),
         invert: bool = False,
     ) -> Tuple[List[date], List[float]]:
-        catdata = self.catlist(
-            labels=labels, spender=spender, startdate=startdate, enddate=enddate
-        )
+        """Laufende Summe der passenden Einträge, nach Datum sortiert."""
 
-        dates = []
-        sums = []
-        for d in catdata:
-            dates.append(d.date)
-            sum = 0
-            if len(sums):
-                sum = sums[-1]
+        def compute():
+            days, cents = self._store.query_cumulated(
+                dict(
+                    labels=labels, spender=spender, startdate=startdate, enddate=enddate
+                )
+            )
+            sign = 1 - 2 * int(invert)
+            return days.tolist(), [sign * int(c) / 100 for c in cents]
 
-            sums.append(sum + (1 - 2 * int(invert)) * d.value / 100)
+        key = _query_key(labels, None, spender, startdate, enddate, None, invert)
+        dates, sums = self._results.get(("catsum",) + key, compute)
+        return list(dates), list(sums)
 
     def catplotdata(
         self,
@@ -586,7 +773,7 @@ class Monitor:
         enddate: date = date(2050, 1, 31),
         invert: bool = False,
     ) -> Tuple[List[date], List[float], List[str]]:
-        catdata = self.catlist(
+        catdata = self._catlist(
             labels=labels, spender=spender, startdate=startdate, enddate=enddate
         )
 
@@ -0,0 +1,146 @@
+"""
+Zeichnet Plots ohne den globalen Zustand von pyplot.
+
+Ein PlotJob enthält die fertig berechneten Daten eines Plots und ist picklebar,
+sodass viele Plots auf Worker-Prozesse verteilt werden können. Jeder Prozess
+zeichnet in eine einzige Figure, die zwischen den Plots geleert wird.
+"""
+from typing import Any, List, NamedTuple, Sequence
+
+FIGSIZE = [16, 9]
+
+
+class PlotJob(NamedTuple):
+    kind: str
+    filename: str
+    data: Any
+
+
+def _draw_periodbars(ax, series):
+    """Gestapelte Balken, series ist eine Liste von (label, dates, sums)."""
+    bottom_dict = {}
+    for label, dates, sums in series:
+        bottom = [bottom_dict.get(d, 0) for d in dates]
+        ax.bar(dates, sums, bottom=bottom, label=label)
+
+        for d, s in zip(dates, sums):
+            bottom_dict[d] = bottom_dict.get(d, 0) + s
+
+    ax.legend()
+
+
+def _draw_catsums(ax, data):
+    """Zwei Ringe, außen je Query und Spender, innen je Query."""
+    import matplotlib
+    import numpy
+
+    sums, labels, sums_total = data
+
+    inner_steps = numpy.arange(5) * 4
+    outer_steps = [i for i in numpy.arange(20) if not i % 4 == 0]
+    cmap1 = matplotlib.colormaps["tab20b"]
+    cmap2 = matplotlib.colormaps["tab20c"]
+    inner_colors = numpy.concatenate((cmap1(inner_steps), cmap2(inner_steps)))
+    outer_colors = numpy.concatenate((cmap1(outer_steps), cmap2(outer_steps)))
+
+    sumsum = numpy.sum(sums)
+
+    ax.pie(
+        sums,
+        labels=labels,
+        # autopct=lambda pct: f"{(pct / 100 * sumsum):,.2f} €",
+        radius=0.8,
+        wedgeprops=dict(width=0.3, edgecolor="w"),
+        colors=outer_colors,
+    )
+    ax.pie(
+        sums_total,
+        autopct=lambda pct: f"{(pct / 100 * sumsum):,.2f} €",
+        radius=0.5,
+        wedgeprops=dict(width=0.3, edgecolor="w"),
+        colors=inner_colors,
+    )
+    ax.axis("equal")
+    # ax.set_title(f"Total {sumsum:,.2f} €")
+
+
+def _draw_catsum(ax, series):
+    """Treppenkurven, series ist eine Liste von (label, dates, sums)."""
+    for label, dates, sums in series:
+        ax.step(dates, sums, label=label, where="post")
+
+    ax.legend()
+
+
+def _draw_cat(ax, series):
+    """Einzelbuchungen, series ist eine Liste von (label, dates, sums)."""
+    for i, (label, dates, sums) in enumerate(series):
+        if dates:
+            ax.stem(dates, sums, label=label, markerfmt=["o", "P", "X", "v", "^"][i])
+
+    ax.legend()
+
+
+_DRAW = {
+    "periodbars": _draw_periodbars,
+    "catsums": _draw_catsums,
+    "catsum": _draw_catsum,
+    "cat": _draw_cat,
+}
+
+
+class Renderer:
+    """
+    Zeichnet PlotJobs nacheinander in dieselbe Figure.
+
+    Die Figure hängt direkt an einem Agg Canvas und ist pyplot unbekannt, sie
+    wird also weder global registriert noch muss sie geschlossen werden.
+    """
+
+    def __init__(self, figsize: Sequence[float] = FIGSIZE):
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+
+        self._figure = Figure(figsize=figsize)
+        FigureCanvasAgg(self._figure)
+
+    def render(self, job: PlotJob) -> str:
+        if job.kind not in _DRAW:
+            raise ValueError(f"Unknown plot kind {job.kind}")
+
+        fig = self._figure
+        fig.clear()
+        _DRAW[job.kind](fig.subplots(), job.data)
+        fig.tight_layout()
+        fig.savefig(job.filename)
+        fig.clear()
+        return job.filename
+
+
+# Renderer des aktuellen Prozesses, wird beim ersten Plot angelegt
+_renderer = None
+
+
+def render(job: PlotJob) -> str:
+    global _renderer
+    if _renderer is None:
+        _renderer = Renderer()
+
+    return _renderer.render(job)
+
+
+def render_many(jobs: Sequence[PlotJob], workers: int = 1) -> List[str]:
+    """
+    Zeichnet mehrere Plots. Bei workers > 1 werden sie auf einen Pool von
+    Prozessen verteilt, die jeweils ihre eigene Figure wiederverwenden.
+    """
+    if workers <= 1 or len(jobs) <= 1:
+        return [render(job) for job in jobs]
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    workers = min(workers, len(jobs))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(
+            executor.map(render, jobs, chunksize=max(1, len(jobs) // (4 * workers)))
+        )
@@ -0,0 +1,266 @@
+"""
+Hält einen Monitor im Speicher und beantwortet Abfragen per JSON-RPC über einen
+Unix Socket. Eine Anfrage und ihre Antwort sind jeweils eine Zeile JSON.
+
+Kontoauszüge und Regeldateien werden beobachtet, bei Änderungen wird neu
+importiert. Unveränderte Dateien kommen dabei aus dem Cache.
+"""
+import json
+import os
+import socket
+import socketserver
+import threading
+from datetime import date
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from pydantic import ValidationError
+
+from fimo import importer, monitor
+from fimo.exception import FimoException
+from fimo.monitor import RecordQuery
+from fimo.watch import SourceWatcher
+
+SOCKET_PATH = Path(os.environ["HOME"]).joinpath(".fimo.sock")
+POLL_INTERVAL = 2.0
+
+# JSON-RPC error codes
+INVALID_PARAMS = -32602
+INTERNAL_ERROR = -32603
+
+_PLOTS = {
+    "monthlycatsum": "org_monthlycatsumplot",
+    "catsums": "org_catsumsplot",
+    "catsum": "org_catsumplot",
+    "cat": "org_catplot",
+}
+
+
+def _record_dict(r: importer.AccountRecord) -> Dict:
+    return {
+        "date": r.date.isoformat(),
+        "value": r.value / 100,
+        "account": r.account.name,
+        "spender": r.spender,
+        "labels": list(r.labels),
+        "comment": list(r.comment),
+        "receiver": r.receiver,
+        "payer": r.payer,
+        "purpose": r.purpose,
+    }
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        from jsonrpc import JSONRPCResponseManager
+
+        for line in self.rfile:
+            if not line.strip():
+                continue
+
+            response = JSONRPCResponseManager.handle(
+                line.decode("utf-8"), self.server.dispatcher
+            )
+            if response is None:
+                continue
+
+            try:
+                text = response.json
+            except (TypeError, ValueError) as e:
+                # a result or error data that JSON can't take must not end the
+                # connection, the client gets an error instead
+                text = json.dumps(
+                    {
+                        "jsonrpc": "2.0",
+                        "error": {"code": INTERNAL_ERROR, "message": str(e)},
+                        "id": getattr(response, "_id", None),
+                    }
+                )
+            self.wfile.write(text.encode("utf-8") + b"\n")
+            self.wfile.flush()
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class FimoServer:
+    def __init__(
+        self,
+        accounts: List[importer.Account],
+        socketpath: Path = SOCKET_PATH,
+        poll_interval: float = POLL_INTERVAL,
+        use_cache: bool = True,
+        workers: int = 1,
+        database: Optional[Path] = None,
+    ):
+        try:
+            from jsonrpc import Dispatcher
+        except ImportError:
+            raise FimoException(
+                "fimo serve needs the json-rpc package, install fimo[server]"
+            )
+
+        self._socketpath = Path(socketpath)
+        self._poll_interval = poll_interval
+        # der Monitor ist nicht threadsicher, Anfragen und Reimport nacheinander
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._watcher = SourceWatcher(accounts)
+        self._monitor = monitor.Monitor(
+            accounts, use_cache=use_cache, workers=workers, database=database
+        )
+
+        self.dispatcher = Dispatcher()
+        for name in [
+            "catlist",
+            "sum",
+            "org_list",
+            "org_labels",
+            "monthlycatsumplotdata",
+            "compensation",
+            "plot",
+            "reload",
+            "stats",
+        ]:
+            self.dispatcher.add_method(self._locked(getattr(self, name)), name=name)
+
+        self._server = None
+
+    def _locked(self, method):
+        from jsonrpc.exceptions import JSONRPCDispatchException
+
+        def call(*args, **kwargs):
+            try:
+                with self._lock:
+                    return method(*args, **kwargs)
+            except (ValidationError, FimoException, ValueError, KeyError) as e:
+                # bad queries, dates or enum names: an error for the client,
+                # not exception objects json-rpc would put into the response
+                raise JSONRPCDispatchException(code=INVALID_PARAMS, message=str(e))
+
+        return call
+
+    def catlist(self, query: Dict) -> List[Dict]:
+        q = RecordQuery.parse_obj(query)
+        return [
+            _record_dict(r)
+            for r in self._monitor.catlist(
+                labels=q.labels,
+                spender=q.spender,
+                startdate=q.startdate,
+                enddate=q.enddate,
+                value=q.value,
+            )
+        ]
+
+    def sum(self, query: Dict) -> float:
+        q = RecordQuery.parse_obj(query)
+        return self._monitor.sum(
+            labels=q.labels,
+            spender=q.spender,
+            startdate=q.startdate,
+            enddate=q.enddate,
+            value=q.value,
+            invert=q.invert,
+        )
+
+    def org_list(self, query: Dict, **kwargs) -> List:
+        if "sort_field" in kwargs:
+            kwargs["sort_field"] = monitor.SortField[kwargs["sort_field"]]
+        return self._monitor.org_list(RecordQuery.parse_obj(query), **kwargs)
+
+    def org_labels(self, query: Dict) -> List:
+        return self._monitor.org_labels(RecordQuery.parse_obj(query))
+
+    def monthlycatsumplotdata(self, query: Dict, period: str = "MONTHLY") -> List:
+        q = RecordQuery.parse_obj(query)
+        return list(
+            self._monitor.monthlycatsumplotdata(
+                q.labels,
+                q.spender,
+                q.startdate,
+                q.enddate,
+                invert=q.invert,
+                period=monitor.Period[period],
+            )
+        )
+
+    def compensation(
+        self,
+        spender: str,
+        compensated_labels: List[str],
+        transfer_labels: List[str],
+        startdate: str,
+        enddate: str,
+    ) -> float:
+        return self._monitor.compensation(
+            spender,
+            compensated_labels,
+            transfer_labels,
+            date.fromisoformat(startdate),
+            date.fromisoformat(enddate),
+        )
+
+    def plot(self, kind: str, queries: List[Dict], filename: str) -> str:
+        if kind not in _PLOTS:
+            raise FimoException(f"Unknown plot {kind}")
+
+        return getattr(self._monitor, _PLOTS[kind])(
+            [RecordQuery.parse_obj(q) for q in queries], filename
+        )
+
+    def reload(self) -> bool:
+        return self._monitor.reload()
+
+    def stats(self) -> Dict[str, int]:
+        return self._monitor.query_cache_stats()
+
+    def _watch(self):
+        while not self._stopped.wait(self._poll_interval):
+            if self._watcher.poll():
+                with self._lock:
+                    self._monitor.reload()
+
+    def serve_forever(self):
+        if self._socketpath.exists():
+            self._socketpath.unlink()
+
+        self._server = _UnixServer(str(self._socketpath), _Handler)
+        self._server.dispatcher = self.dispatcher
+        watcher = threading.Thread(target=self._watch, daemon=True)
+        watcher.start()
+        try:
+            self._server.serve_forever()
+        finally:
+            self._stopped.set()
+            self._server.server_close()
+            if self._socketpath.exists():
+                self._socketpath.unlink()
+
+    def shutdown(self):
+        if self._server:
+            self._server.shutdown()
+
+
+def call(method: str, socketpath: Optional[Path] = None, **params):
+    """
+    Fragt einen laufenden fimo serve ab, z.B. aus einem org-babel Block:
+
+        call("sum", query={"labels": ["Lebensmittel"]})
+    """
+    request = {"jsonrpc": "2.0", "method": method, "params": params, "id": 1}
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        s.connect(str(socketpath if socketpath else SOCKET_PATH))
+        s.sendall(json.dumps(request, default=str).encode("utf-8") + b"\n")
+        with s.makefile("rb") as f:
+            response = json.loads(f.readline())
+
+    if "error" in response:
+        error = response["error"]
+        data = error.get("data")
+        if isinstance(data, dict) and "message" in data:
+            raise FimoException(data["message"])
+        raise FimoException(error["message"])
+
+    return response["result"]
@@ -0,0 +1,511 @@
+"""
+Einträge in einer SQLite Datei statt im Speicher, für lange Historien.
+
+Die Kontoauszüge werden dateiweise übertragen, unveränderte Dateien (gleicher
+Fingerabdruck wie im Cache) bleiben in der Datenbank stehen. Abfragen werden zu
+SQL über Indizes auf Datum, Spender und Label, im Speicher liegen nur die
+Ergebnisse.
+"""
+import sqlite3
+from collections import Counter
+from datetime import date
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy
+
+from fimo import importer
+from fimo.store import LabelStats
+
+# bump when the schema changes, the database is rebuilt then
+SCHEMA_VERSION = 2
+
+_SCHEMA = """
+CREATE TABLE paths (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE
+);
+CREATE TABLE files (
+    path_id INTEGER PRIMARY KEY REFERENCES paths(id),
+    account TEXT NOT NULL,
+    account_pos INTEGER NOT NULL,
+    fingerprint TEXT,
+    import_errors TEXT NOT NULL
+);
+CREATE TABLE records (
+    id INTEGER PRIMARY KEY,
+    file_id INTEGER NOT NULL REFERENCES files(path_id) ON DELETE CASCADE,
+    src_line INTEGER NOT NULL,
+    date TEXT NOT NULL,
+    value INTEGER NOT NULL,
+    spender TEXT NOT NULL,
+    receiver TEXT NOT NULL,
+    payer TEXT NOT NULL,
+    purpose TEXT NOT NULL,
+    comment TEXT NOT NULL,
+    preview_path_id INTEGER REFERENCES paths(id),
+    preview_line INTEGER,
+    -- Fingerabdruck der Buchung und ihr wievieltes Vorkommen in der Datei
+    overlap_key TEXT NOT NULL,
+    occurrence INTEGER NOT NULL,
+    -- steht schon in einem früheren Auszug eines Kontos mit skip_overlaps
+    overlap INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE record_labels (
+    record_id INTEGER NOT NULL REFERENCES records(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    label TEXT NOT NULL,
+    PRIMARY KEY (record_id, position)
+) WITHOUT ROWID;
+CREATE TABLE label_sources (
+    record_id INTEGER NOT NULL REFERENCES records(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    path_id INTEGER NOT NULL REFERENCES paths(id),
+    line INTEGER NOT NULL,
+    PRIMARY KEY (record_id, position)
+) WITHOUT ROWID;
+CREATE INDEX records_date ON records(date);
+CREATE INDEX records_spender_date ON records(spender, date);
+CREATE INDEX records_file ON records(file_id, src_line);
+CREATE INDEX record_labels_label ON record_labels(label, record_id);
+CREATE INDEX records_overlap ON records(overlap_key, occurrence);
+"""
+
+# Reihenfolge der Einträge wie in RecordStore: Konto, Datei, Zeile
+_ORDER = "f.account_pos, p.path, r.src_line"
+
+_FROM = """
+FROM records r
+JOIN files f ON f.path_id = r.file_id
+JOIN paths p ON p.id = f.path_id
+"""
+
+
+class SQLiteStore:
+    """
+    Einträge aller Konten in einer SQLite Datenbank.
+
+    Bietet dieselben query_* Abfragen wie RecordStore, die Filter sind Dicts mit
+    labels, exclude_labels, spender, startdate, enddate und value.
+    """
+
+    def __init__(self, dbpath: Path):
+        self._dbpath = Path(dbpath)
+        self._conn = sqlite3.connect(self._dbpath, check_same_thread=False)
+        self._conn.execute("PRAGMA foreign_keys = ON")
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        if self._conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            self._create_schema()
+
+        self.catalog = importer.SourceCatalog()
+        self._accounts: Dict[str, importer.Account] = {}
+        # path id in der Datenbank -> file id im Katalog
+        self._file_ids: Dict[int, int] = {}
+        # Label -> Rang seines ersten Vorkommens über alle Einträge
+        self._label_order: Optional[Dict[str, int]] = None
+
+    def _create_schema(self):
+        with self._conn:
+            tables = [
+                row[0]
+                for row in self._conn.execute(
+                    "SELECT name FROM sqlite_master WHERE type = 'table'"
+                )
+            ]
+            self._conn.execute("PRAGMA foreign_keys = OFF")
+            for table in tables:
+                self._conn.execute(f"DROP TABLE {table}")
+            self._conn.execute("PRAGMA foreign_keys = ON")
+            self._conn.executescript(_SCHEMA)
+            self._conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def close(self):
+        self._conn.close()
+
+    def __len__(self) -> int:
+        return self._conn.execute(
+            "SELECT COUNT(*) FROM records WHERE overlap = 0"
+        ).fetchone()[0]
+
+    def _path_id(self, filepath: Path) -> int:
+        path = str(filepath)
+        self._conn.execute("INSERT OR IGNORE INTO paths (path) VALUES (?)", (path,))
+        return self._conn.execute(
+            "SELECT id FROM paths WHERE path = ?", (path,)
+        ).fetchone()[0]
+
+    def sync(
+        self, accounts: List[importer.Account], use_cache: bool = True
+    ) -> List[Path]:
+        """
+        Überträgt die Kontoauszüge der Konten in die Datenbank. Dateien, deren
+        Fingerabdruck sich nicht geändert hat, werden nicht erneut importiert,
+        Dateien verschwundener Konten und Auszüge werden entfernt.
+
+        Gibt die neu übertragenen und die entfernten Dateien zurück.
+        """
+        self._accounts = {account.name: account for account in accounts}
+        self._label_order = None
+        known = {
+            path: fingerprint
+            for path, fingerprint in self._conn.execute(
+                "SELECT p.path, f.fingerprint FROM files f "
+                "JOIN paths p ON p.id = f.path_id"
+            )
+        }
+
+        written = []
+        seen = set()
+        for pos, account in enumerate(accounts):
+
+            def unchanged(filepath: Path, fingerprint: str) -> bool:
+                seen.add(str(filepath))
+                return known.get(str(filepath)) == fingerprint
+
+            imp = importer.AccountImporter(
+                account, use_cache=use_cache, catalog=importer.SourceCatalog()
+            )
+            for fimp, fingerprint in imp.import_each(unchanged):
+                seen.add(str(fimp._filepath))
+                self._write_file(account, pos, fimp, fingerprint)
+                written.append(fimp._filepath)
+
+            with self._conn:
+                self._conn.execute(
+                    "UPDATE files SET account_pos = ? WHERE account = ?",
+                    (pos, account.name),
+                )
+
+        removed = sorted(set(known) - seen)
+        with self._conn:
+            for path in removed:
+                self._conn.execute(
+                    "DELETE FROM files WHERE path_id = "
+                    "(SELECT id FROM paths WHERE path = ?)",
+                    (path,),
+                )
+
+        if written or removed:
+            self._mark_overlaps(
+                [account.name for account in accounts if account.skip_overlaps]
+            )
+
+        return written + [Path(path) for path in removed]
+
+    def _mark_overlaps(self, accounts: List[str]):
+        """
+        Markiert die Überschneidungen der Konten wie importer.OverlapIndex: Das
+        n-te Vorkommen eines Fingerabdrucks in einer Datei ist eine
+        Überschneidung, wenn eine frühere Datei des Kontos ihn mindestens n Mal
+        enthält.
+        """
+        with self._conn:
+            self._conn.execute("UPDATE records SET overlap = 0 WHERE overlap")
+            if not accounts:
+                return
+
+            self._conn.execute(
+                f"UPDATE records SET overlap = 1 WHERE id IN ("
+                f"SELECT r.id {_FROM} WHERE f.account IN "
+                f"({', '.join('?' * len(accounts))}) AND EXISTS ("
+                f"SELECT 1 FROM records o "
+                f"JOIN files fo ON fo.path_id = o.file_id "
+                f"JOIN paths po ON po.id = fo.path_id "
+                f"WHERE o.overlap_key = r.overlap_key "
+                f"AND o.occurrence = r.occurrence "
+                f"AND fo.account = f.account AND po.path < p.path))",
+                accounts,
+            )
+
+    def import_errors(self) -> List[str]:
+        """Fehler beim Import der Dateien, in der Reihenfolge der Konten."""
+        errors = []
+        for (text,) in self._conn.execute(
+            "SELECT f.import_errors FROM files f JOIN paths p ON p.id = f.path_id "
+            "ORDER BY f.account_pos, p.path"
+        ):
+            errors.extend(e for e in text.split("\n") if e)
+
+        return errors
+
+    def _write_file(
+        self,
+        account: importer.Account,
+        pos: int,
+        fimp: "importer.FileImporter",
+        fingerprint: Optional[str],
+    ):
+        with self._conn:
+            file_id = self._path_id(fimp._filepath)
+            self._conn.execute("DELETE FROM files WHERE path_id = ?", (file_id,))
+            self._conn.execute(
+                "INSERT INTO files "
+                "(path_id, account, account_pos, fingerprint, import_errors) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (
+                    file_id,
+                    account.name,
+                    pos,
+                    fingerprint,
+                    "\n".join(fimp.import_errors),
+                ),
+            )
+
+            path_ids = {}
+
+            def path_id(ref: Tuple[int, int]) -> int:
+                filepath = fimp._account_importer._catalog.files[ref[0]]
+                if filepath not in path_ids:
+                    path_ids[filepath] = self._path_id(filepath)
+                return path_ids[filepath]
+
+            occurrences = Counter()
+            for r in fimp.data():
+                key = "\x1f".join(str(k) for k in importer.overlap_key(r))
+                record_id = self._conn.execute(
+                    "INSERT INTO records (file_id, src_line, date, value, spender, "
+                    "receiver, payer, purpose, comment, preview_path_id, preview_line, "
+                    "overlap_key, occurrence) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        file_id,
+                        r.src_ref[1],
+                        r.date.isoformat(),
+                        r.value,
+                        account.spender,
+                        r.receiver,
+                        r.payer,
+                        r.purpose,
+                        ",".join(r.comment),
+                        path_id(r.preview_ref) if r.preview_ref else None,
+                        r.preview_ref[1] if r.preview_ref else None,
+                        key,
+                        occurrences[key],
+                    ),
+                ).lastrowid
+                occurrences[key] += 1
+                self._conn.executemany(
+                    "INSERT INTO record_labels (record_id, position, label) "
+                    "VALUES (?, ?, ?)",
+                    [(record_id, i, l) for i, l in enumerate(r.labels)],
+                )
+                self._conn.executemany(
+                    "INSERT INTO label_sources (record_id, position, path_id, line) "
+                    "VALUES (?, ?, ?, ?)",
+                    [
+                        (record_id, i, path_id(ref), ref[1])
+                        for i, ref in enumerate(r.labels_src_refs)
+                    ],
+                )
+
+    def _where(self, f: Dict) -> Tuple[str, List]:
+        clauses, params = ["r.overlap = 0"], []
+        if f.get("startdate") is not None:
+            clauses.append("r.date >= ?")
+            params.append(f["startdate"].isoformat())
+        if f.get("enddate") is not None:
+            clauses.append("r.date < ?")
+            params.append(f["enddate"].isoformat())
+        if f.get("spender") is not None:
+            clauses.append("r.spender = ?")
+            params.append(f["spender"])
+        for key, op in [("labels", "IN"), ("exclude_labels", "NOT IN")]:
+            labels = sorted(set(f.get(key) or []))
+            if labels:
+                clauses.append(
+                    f"r.id {op} (SELECT record_id FROM record_labels "
+                    f"WHERE label IN ({', '.join('?' * len(labels))}))"
+                )
+                params.extend(labels)
+        if f.get("value"):
+            clauses.append("abs(r.value) = ?")
+            params.append(abs(round(f["value"] * 100)))
+
+        return " AND ".join(clauses), params
+
+    def _catalog_file_id(self, path_id: int, path: Optional[str] = None) -> int:
+        if path_id not in self._file_ids:
+            if path is None:
+                path = self._conn.execute(
+                    "SELECT path FROM paths WHERE id = ?", (path_id,)
+                ).fetchone()[0]
+            self._file_ids[path_id] = self.catalog.file_id(Path(path))
+
+        return self._file_ids[path_id]
+
+    def _select(self, f: Dict) -> List[importer.Record]:
+        where, params = self._where(f)
+        labels: Dict[int, List[str]] = {}
+        for record_id, label in self._conn.execute(
+            f"SELECT l.record_id, l.label FROM record_labels l WHERE l.record_id IN "
+            f"(SELECT r.id FROM records r WHERE {where}) "
+            f"ORDER BY l.record_id, l.position",
+            params,
+        ):
+            labels.setdefault(record_id, []).append(label)
+
+        sources: Dict[int, List[Tuple[int, int]]] = {}
+        for record_id, path_id, line in self._conn.execute(
+            f"SELECT s.record_id, s.path_id, s.line FROM label_sources s "
+            f"WHERE s.record_id IN (SELECT r.id FROM records r WHERE {where}) "
+            f"ORDER BY s.record_id, s.position",
+            params,
+        ):
+            sources.setdefault(record_id, []).append(
+                (self._catalog_file_id(path_id), line)
+            )
+
+        records = []
+        for row in self._conn.execute(
+            f"SELECT r.id, f.account, f.path_id, p.path, r.src_line, r.date, "
+            f"r.value, r.receiver, r.payer, r.purpose, r.comment, "
+            f"r.preview_path_id, r.preview_line {_FROM} WHERE {where} ORDER BY {_ORDER}",
+            params,
+        ):
+            (
+                record_id,
+                account,
+                file_id,
+                path,
+                src_line,
+                day,
+                value,
+                receiver,
+                payer,
+                purpose,
+                comment,
+                preview_path_id,
+                preview_line,
+            ) = row
+            records.append(
+                importer.Record(
+                    self.catalog,
+                    self.catalog.account_id(self._accounts[account]),
+                    date=date.fromisoformat(day),
+                    value=value,
+                    receiver_id=self.catalog.text_id(receiver),
+                    payer_id=self.catalog.text_id(payer),
+                    purpose_id=self.catalog.text_id(purpose),
+                    labels_id=self.catalog.text_list_id(labels.get(record_id, [])),
+                    comment_id=self.catalog.split_id(comment),
+                    src_ref=(self._catalog_file_id(file_id, path), src_line),
+                    preview_ref=(self._catalog_file_id(preview_path_id), preview_line)
+                    if preview_path_id is not None
+                    else None,
+                    labels_src_refs=tuple(sources.get(record_id, [])),
+                )
+            )
+
+        return records
+
+    def query_records(self, filters: Sequence[Dict]) -> List[List[importer.Record]]:
+        return [self._select(f) for f in filters]
+
+    def query_totals(self, filters: Sequence[Dict]) -> List[int]:
+        totals = []
+        for f in filters:
+            where, params = self._where(f)
+            total = self._conn.execute(
+                f"SELECT SUM(r.value) FROM records r WHERE {where}", params
+            ).fetchone()[0]
+            totals.append(int(total or 0))
+
+        return totals
+
+    def query_binned_totals(self, edges: Sequence[date], f: Dict) -> numpy.ndarray:
+        """Summen in Cent je Intervall [edges[i], edges[i + 1]), ohne Zeitraum."""
+        nbins = len(edges) - 1
+        if nbins < 1:
+            return numpy.zeros(0, dtype=numpy.int64)
+
+        f = dict(f, startdate=edges[0], enddate=edges[-1])
+        where, params = self._where(f)
+        rows = self._conn.execute(
+            f"SELECT r.date, SUM(r.value) FROM records r WHERE {where} "
+            f"GROUP BY r.date",
+            params,
+        ).fetchall()
+        days = numpy.array([d for d, _ in rows], dtype="datetime64[D]")
+        sums = numpy.array([s for _, s in rows], dtype=numpy.int64)
+        bins = (
+            numpy.searchsorted(
+                numpy.array(edges, dtype="datetime64[D]"), days, side="right"
+            )
+            - 1
+        )
+        totals = numpy.zeros(nbins, dtype=numpy.int64)
+        numpy.add.at(totals, bins, sums)
+        return totals
+
+    def query_cumulated(self, f: Dict) -> Tuple[numpy.ndarray, numpy.ndarray]:
+        where, params = self._where(f)
+        rows = self._conn.execute(
+            f"SELECT r.date, r.value {_FROM} WHERE {where} "
+            f"ORDER BY r.date, {_ORDER}",
+            params,
+        ).fetchall()
+        days = numpy.array([d for d, _ in rows], dtype="datetime64[D]")
+        values = numpy.array([v for _, v in rows], dtype=numpy.int64)
+        return days, numpy.cumsum(values)
+
+    def _labels_in_order(self) -> Dict[str, int]:
+        if self._label_order is None:
+            self._label_order = {}
+            for (label,) in self._conn.execute(
+                f"SELECT l.label {_FROM} JOIN record_labels l ON l.record_id = r.id "
+                f"WHERE r.overlap = 0 ORDER BY {_ORDER}, l.position"
+            ):
+                self._label_order.setdefault(label, len(self._label_order))
+
+        return self._label_order
+
+    def query_labels_in_use(self, f: Dict) -> List[str]:
+        where, params = self._where(f)
+        return [
+            label
+            for (label,) in self._conn.execute(
+                f"SELECT l.label {_FROM} JOIN record_labels l ON l.record_id = r.id "
+                f"WHERE {where} ORDER BY {_ORDER}, l.position",
+                params,
+            )
+        ]
+
+    def query_label_stats(self, f: Dict) -> LabelStats:
+        """
+        Aggregiert in SQL wie label_stats() im Speicher: counts zählt Vorkommen,
+        Summe und Datumsbereich jeden Eintrag einmal. Die Labels stehen wie dort
+        in der Reihenfolge ihres ersten Vorkommens in allen Einträgen.
+        """
+        where, params = self._where(f)
+        rows = self._conn.execute(
+            f"SELECT d.label, SUM(d.n), SUM(r.value), MIN(r.date), MAX(r.date) "
+            f"FROM (SELECT record_id, label, COUNT(*) AS n FROM record_labels "
+            f"WHERE record_id IN (SELECT r.id FROM records r WHERE {where}) "
+            f"GROUP BY record_id, label) d "
+            f"JOIN records r ON r.id = d.record_id GROUP BY d.label",
+            params,
+        ).fetchall()
+        order = self._labels_in_order()
+        rows.sort(key=lambda row: order[row[0]])
+        return LabelStats(
+            [row[0] for row in rows],
+            numpy.array([row[1] for row in rows], dtype=numpy.int64),
+            numpy.array([row[2] for row in rows], dtype=numpy.int64),
+            numpy.array([row[3] for row in rows], dtype="datetime64[D]"),
+            numpy.array([row[4] for row in rows], dtype="datetime64[D]"),
+        )
+
+    def query_label_cooccurrence(self, f: Dict) -> Dict[str, Dict[str, int]]:
+        where, params = self._where(f)
+        cooccurrence: Dict[str, Dict[str, int]] = {}
+        for a, b, count in self._conn.execute(
+            f"SELECT a.label, b.label, COUNT(DISTINCT a.record_id) "
+            f"FROM record_labels a JOIN record_labels b "
+            f"ON b.record_id = a.record_id AND b.label <> a.label "
+            f"WHERE a.record_id IN (SELECT r.id FROM records r WHERE {where}) "
+            f"GROUP BY a.label, b.label",
+            params,
+        ):
+            cooccurrence.setdefault(a, {})[b] = count
+
+        return cooccurrence
@@ -0,0 +1,556 @@
+from datetime import date
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy
+
+from fimo import importer
+
+
+class LabelStats(NamedTuple):
+    """
+    Kennzahlen je Label, alle Arrays in der Reihenfolge von labels.
+
+    counts zählt Vorkommen (wie labels_in_use), totals, first und last beziehen
+    sich auf die Einträge mit dem Label. Welche Labels zusammen vorkommen,
+    liefert query_label_cooccurrence() der Stores.
+    """
+
+    labels: List[str]
+    counts: numpy.ndarray
+    totals: numpy.ndarray
+    first: numpy.ndarray
+    last: numpy.ndarray
+
+
+class RecordStore:
+    """
+    Spaltenweise Ablage aller importierten Einträge.
+
+    Datum, Betrag (in Cent) und Spender liegen als NumPy Arrays vor, zu jedem Label
+    gibt es eine Liste der Zeilen, in denen es vorkommt. Filter werden so zu Masken
+    über die Arrays statt zu Schleifen über die Einträge.
+    """
+
+    def __init__(self, records: Sequence[importer.Record]):
+        self.records = list(records)
+
+        self.dates = numpy.array([r.date for r in self.records], dtype="datetime64[D]")
+        self.values = numpy.array([r.value for r in self.records], dtype=numpy.int64)
+
+        self.spenders = sorted({r.spender for r in self.records})
+        self._spender_codes = {s: i for i, s in enumerate(self.spenders)}
+        self.spender_codes = numpy.array(
+            [self._spender_codes[r.spender] for r in self.records], dtype=numpy.int32
+        )
+
+        postings: Dict[str, List[int]] = {}
+        label_codes: Dict[str, int] = {}
+        # jedes Vorkommen eines Labels, first_occ markiert das erste im Eintrag
+        occ_rows, occ_labels, first_occ = [], [], []
+        # je Eintrag alle Paare verschiedener Labels (a < b)
+        pair_rows, pair_a, pair_b = [], [], []
+        # die Labels jeder Kombination im Katalog nur einmal auswerten:
+        # Vorkommen, erste Vorkommen, Labels und Paare
+        combos: Dict[Tuple, Tuple] = {}
+        for i, r in enumerate(self.records):
+            combo = combos.get((r.catalog, r.labels_id))
+            if combo is None:
+                codes, firsts, names = [], [], []
+                for l in r.labels:
+                    code = label_codes.setdefault(l, len(label_codes))
+                    firsts.append(code not in codes)
+                    if code not in codes:
+                        codes.append(code)
+                        names.append(l)
+                occurrences = [label_codes[l] for l in r.labels]
+                codes.sort()
+                pairs = [
+                    (codes[a], codes[b])
+                    for a in range(len(codes))
+                    for b in range(a + 1, len(codes))
+                ]
+                combo = combos[(r.catalog, r.labels_id)] = (
+                    occurrences,
+                    firsts,
+                    names,
+                    pairs,
+                )
+
+            occurrences, firsts, names, pairs = combo
+            occ_rows.extend([i] * len(occurrences))
+            occ_labels.extend(occurrences)
+            first_occ.extend(firsts)
+            for l in names:
+                postings.setdefault(l, []).append(i)
+            for a, b in pairs:
+                pair_rows.append(i)
+                pair_a.append(a)
+                pair_b.append(b)
+
+        self._postings = {
+            l: numpy.array(rows, dtype=numpy.int64) for l, rows in postings.items()
+        }
+
+        self._label_names = list(label_codes)
+        self._occ_rows = numpy.array(occ_rows, dtype=numpy.int64)
+        self._occ_labels = numpy.array(occ_labels, dtype=numpy.int32)
+        self._first_occ = numpy.array(first_occ, dtype=bool)
+        self._pair_rows = numpy.array(pair_rows, dtype=numpy.int64)
+        self._pair_keys = numpy.array(pair_a, dtype=numpy.int64) * len(
+            label_codes
+        ) + numpy.array(pair_b, dtype=numpy.int64)
+        self._prefix_index: Optional[PrefixIndex] = None
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def label_mask(self, labels: List[str]) -> numpy.ndarray:
+        """Maske aller Einträge, die mindestens eines der Labels tragen."""
+        mask = numpy.zeros(len(self.records), dtype=bool)
+        for l in set(labels):
+            if l in self._postings:
+                mask[self._postings[l]] = True
+
+        return mask
+
+    def spender_mask(self, spender: str) -> numpy.ndarray:
+        if spender not in self._spender_codes:
+            return numpy.zeros(len(self.records), dtype=bool)
+
+        return self.spender_codes == self._spender_codes[spender]
+
+    def mask_many(self, filters: Sequence[Dict]) -> List[numpy.ndarray]:
+        """
+        Masken für mehrere Filter mit den Schlüsseln labels, exclude_labels,
+        spender, startdate, enddate und value (alle optional).
+
+        Teilmasken, die in mehreren Filtern vorkommen (gleiche Labelmenge, Spender
+        oder Zeitraum), werden nur einmal berechnet.
+        """
+        parts = {}
+
+        def part(key, compute):
+            if key not in parts:
+                parts[key] = compute()
+            return parts[key]
+
+        masks = []
+        for f in filters:
+            labels = f.get("labels")
+            exclude_labels = f.get("exclude_labels")
+            spender = f.get("spender")
+            startdate = f.get("startdate")
+            enddate = f.get("enddate")
+            value = f.get("value")
+
+            mask = numpy.ones(len(self.records), dtype=bool)
+            if startdate is not None:
+                mask &= part(
+                    ("start", startdate),
+                    lambda: self.dates >= numpy.datetime64(startdate, "D"),
+                )
+            if enddate is not None:
+                mask &= part(
+                    ("end", enddate),
+                    lambda: self.dates < numpy.datetime64(enddate, "D"),
+                )
+            if labels:
+                mask &= part(
+                    ("labels", frozenset(labels)), lambda: self.label_mask(labels)
+                )
+            if exclude_labels:
+                mask &= ~part(
+                    ("labels", frozenset(exclude_labels)),
+                    lambda: self.label_mask(exclude_labels),
+                )
+            if spender is not None:
+                mask &= part(("spender", spender), lambda: self.spender_mask(spender))
+            if value:
+                mask &= part(
+                    ("value", abs(round(value * 100))),
+                    lambda: numpy.abs(self.values) == abs(round(value * 100)),
+                )
+
+            masks.append(mask)
+
+        return masks
+
+    # Abfragen mit Filtern wie bei mask_many(), dieselben bietet SQLiteStore
+
+    def query_records(self, filters: Sequence[Dict]) -> List[List[importer.Record]]:
+        return [self.select(mask) for mask in self.mask_many(filters)]
+
+    def query_totals(self, filters: Sequence[Dict]) -> List[int]:
+        """
+        Summen in Cent je Filter. Filter ohne value kommen aus dem Index der
+        Präfixsummen, die übrigen gemeinsam aus Masken.
+        """
+        index = self.prefix_index()
+        totals = [
+            None
+            if f.get("value")
+            else index.total(
+                labels=f.get("labels"),
+                exclude_labels=f.get("exclude_labels"),
+                spender=f.get("spender"),
+                startdate=f.get("startdate"),
+                enddate=f.get("enddate"),
+            )
+            for f in filters
+        ]
+
+        scanned = [i for i, total in enumerate(totals) if total is None]
+        if scanned:
+            masks = self.mask_many([filters[i] for i in scanned])
+            for i, total in zip(scanned, self.totals(masks)):
+                totals[i] = int(total)
+
+        return totals
+
+    def query_binned_totals(self, edges: Sequence[date], f: Dict) -> numpy.ndarray:
+        """Summen in Cent je Intervall [edges[i], edges[i + 1]), ohne Zeitraum."""
+        return self.prefix_index().binned_totals(
+            edges,
+            labels=f.get("labels"),
+            exclude_labels=f.get("exclude_labels"),
+            spender=f.get("spender"),
+        )
+
+    def query_cumulated(self, f: Dict) -> Tuple[numpy.ndarray, numpy.ndarray]:
+        return self.prefix_index().cumulated(
+            labels=f.get("labels"),
+            exclude_labels=f.get("exclude_labels"),
+            spender=f.get("spender"),
+            startdate=f.get("startdate"),
+            enddate=f.get("enddate"),
+        )
+
+    def query_labels_in_use(self, f: Dict) -> List[str]:
+        """Die Labels der passenden Einträge, jedes Vorkommen in ihrer Reihenfolge."""
+        mask = self.mask_many([f])[0]
+        return [
+            self._label_names[i]
+            for i in self._occ_labels[mask[self._occ_rows]].tolist()
+        ]
+
+    def query_label_stats(self, f: Dict) -> LabelStats:
+        """
+        Ohne Filter auf Labels oder Betrag aus dem Index der Präfixsummen, sonst
+        über die Vorkommen der Labels in der Maske.
+        """
+        if f.get("labels") or f.get("exclude_labels") or f.get("value"):
+            return self.label_stats(self.mask_many([f])[0])
+
+        return self.prefix_index().label_stats(
+            spender=f.get("spender"),
+            startdate=f.get("startdate"),
+            enddate=f.get("enddate"),
+        )
+
+    def query_label_cooccurrence(self, f: Dict) -> Dict[str, Dict[str, int]]:
+        return self.label_cooccurrence(self.mask_many([f])[0])
+
+    def prefix_index(self) -> "PrefixIndex":
+        """Der Index der Präfixsummen, wird beim ersten Aufruf aufgebaut."""
+        if self._prefix_index is None:
+            self._prefix_index = PrefixIndex(self)
+
+        return self._prefix_index
+
+    def select(self, mask: numpy.ndarray) -> List[importer.Record]:
+        return [self.records[i] for i in numpy.flatnonzero(mask)]
+
+    def totals(self, masks: Sequence[numpy.ndarray]) -> numpy.ndarray:
+        """Summen in Cent je Maske, alle Masken in einem Durchlauf."""
+        if not masks:
+            return numpy.zeros(0, dtype=numpy.int64)
+
+        return numpy.stack(masks) @ self.values
+
+    def label_stats(self, mask: numpy.ndarray) -> LabelStats:
+        """
+        Kennzahlen der Labels aller Einträge in mask, nur Labels, die dabei
+        vorkommen. Ausgewertet wird über die Vorkommen der Labels, nicht über die
+        Einträge.
+        """
+        nlabels = len(self._label_names)
+
+        selected = mask[self._occ_rows]
+        counts = numpy.bincount(self._occ_labels[selected], minlength=nlabels)
+
+        unique = selected & self._first_occ
+        labels = self._occ_labels[unique]
+        rows = self._occ_rows[unique]
+        totals = numpy.rint(
+            numpy.bincount(labels, weights=self.values[rows], minlength=nlabels)
+        ).astype(numpy.int64)
+
+        days = self.dates[rows].astype(numpy.int64)
+        first = numpy.full(nlabels, numpy.iinfo(numpy.int64).max)
+        numpy.minimum.at(first, labels, days)
+        last = numpy.full(nlabels, numpy.iinfo(numpy.int64).min)
+        numpy.maximum.at(last, labels, days)
+
+        present = numpy.flatnonzero(counts)
+        return LabelStats(
+            [self._label_names[i] for i in present],
+            counts[present],
+            totals[present],
+            first[present].astype("datetime64[D]"),
+            last[present].astype("datetime64[D]"),
+        )
+
+    def label_cooccurrence(self, mask: numpy.ndarray) -> Dict[str, Dict[str, int]]:
+        """
+        Je Label die anderen Labels, die mit ihm an Einträgen in mask stehen, mit
+        der Zahl dieser Einträge. Nur Paare, die vorkommen.
+        """
+        nlabels = len(self._label_names)
+        keys, counts = numpy.unique(
+            self._pair_keys[mask[self._pair_rows]], return_counts=True
+        )
+        cooccurrence: Dict[str, Dict[str, int]] = {}
+        for key, count in zip(keys.tolist(), counts.tolist()):
+            a, b = divmod(key, nlabels)
+            a, b = self._label_names[a], self._label_names[b]
+            cooccurrence.setdefault(a, {})[b] = count
+            cooccurrence.setdefault(b, {})[a] = count
+
+        return cooccurrence
+
+
+class PrefixIndex:
+    """
+    Beträge sortiert nach Spender, Labelkombination und Datum, mit ihren
+    Präfixsummen.
+
+    Einträge mit derselben Menge von Labels teilen sich eine Kombination, so ist
+    die Summe über alle Kombinationen, die eines der gesuchten Labels enthalten,
+    genau die Summe der passenden Einträge. Jede Gruppe (Spender, Kombination)
+    ist ein nach Datum sortierter Abschnitt, die Summe eines Zeitraums also die
+    Differenz zweier Präfixsummen an binär gesuchten Stellen.
+
+    Für die Kennzahlen der Labels gibt es dasselbe je (Spender, Label) über die
+    Einträge mit dem Label, mit Präfixsummen der Beträge und der Vorkommen.
+    """
+
+    def __init__(self, store: "RecordStore"):
+        self._spender_codes = store._spender_codes
+        self._nspenders = len(store.spenders)
+
+        combo_codes: Dict[frozenset, int] = {}
+        # Labelliste im Katalog -> Kombination, gleiche Mengen teilen sich eine
+        list_combos: Dict[Tuple, int] = {}
+        codes = []
+        for r in store.records:
+            code = list_combos.get((r.catalog, r.labels_id))
+            if code is None:
+                code = list_combos[(r.catalog, r.labels_id)] = combo_codes.setdefault(
+                    frozenset(r.labels), len(combo_codes)
+                )
+            codes.append(code)
+        record_combos = numpy.array(codes, dtype=numpy.int64)
+
+        self._label_combos: Dict[str, List[int]] = {}
+        for combo, code in combo_codes.items():
+            for l in combo:
+                self._label_combos.setdefault(l, []).append(code)
+        self._ncombos = len(combo_codes)
+
+        # Schlüssel: Gruppe * width + Tag, Tage relativ zum ersten Eintrag
+        days = store.dates.astype(numpy.int64)
+        self._first_day = int(days.min()) if len(days) else 0
+        # ein Tag Platz hinter dem letzten Eintrag für Grenzen danach
+        self._width = (int(days.max()) - self._first_day + 2) if len(days) else 1
+        groups = store.spender_codes.astype(numpy.int64) * self._ncombos + record_combos
+
+        # bei gleichem Datum bleibt die Reihenfolge der Einträge
+        self._order = numpy.lexsort((days, groups))
+        self._keys = (groups * self._width + days - self._first_day)[self._order]
+        self._days = days[self._order]
+        self._values = store.values[self._order]
+        self._prefix = numpy.zeros(len(self._values) + 1, dtype=numpy.int64)
+        numpy.cumsum(self._values, out=self._prefix[1:])
+
+        # je Eintrag und Label ein Schlüssel, dazu wie oft das Label dort steht
+        self._label_names = store._label_names
+        nlabels = len(self._label_names)
+        pairs, occurrences = numpy.unique(
+            store._occ_rows * nlabels + store._occ_labels, return_counts=True
+        )
+        rows, labels = numpy.divmod(pairs, max(nlabels, 1))
+        label_groups = store.spender_codes[rows].astype(numpy.int64) * nlabels + labels
+        label_days = days[rows]
+        label_order = numpy.lexsort((label_days, label_groups))
+        self._label_keys = (label_groups * self._width + label_days - self._first_day)[
+            label_order
+        ]
+        self._label_days = label_days[label_order]
+        self._label_prefix = numpy.zeros(len(rows) + 1, dtype=numpy.int64)
+        numpy.cumsum(store.values[rows][label_order], out=self._label_prefix[1:])
+        self._occ_prefix = numpy.zeros(len(rows) + 1, dtype=numpy.int64)
+        numpy.cumsum(occurrences[label_order], out=self._occ_prefix[1:])
+
+    def _spenders(self, spender: Optional[str]) -> numpy.ndarray:
+        if spender is None:
+            return numpy.arange(self._nspenders)
+        if spender in self._spender_codes:
+            return numpy.array([self._spender_codes[spender]])
+
+        return numpy.zeros(0, dtype=numpy.int64)
+
+    def _groups(
+        self,
+        labels: Optional[List[str]],
+        exclude_labels: Optional[List[str]],
+        spender: Optional[str],
+    ) -> numpy.ndarray:
+        if labels:
+            selected = numpy.zeros(self._ncombos, dtype=bool)
+            for l in set(labels):
+                selected[self._label_combos.get(l, [])] = True
+        else:
+            selected = numpy.ones(self._ncombos, dtype=bool)
+
+        for l in set(exclude_labels or []):
+            selected[self._label_combos.get(l, [])] = False
+
+        spenders = self._spenders(spender)
+        combos = numpy.flatnonzero(selected)
+        return (spenders[:, None] * self._ncombos + combos[None, :]).ravel()
+
+    def _offset(self, d: Optional[date], default: int) -> int:
+        """Tag d relativ zum ersten Eintrag, begrenzt auf [0, width - 1]."""
+        if d is None:
+            return default
+
+        day = int(numpy.datetime64(d, "D").astype(numpy.int64)) - self._first_day
+        return min(max(day, 0), self._width - 1)
+
+    def _range(self, startdate: Optional[date], enddate: Optional[date]):
+        return numpy.array(
+            [self._offset(startdate, 0), self._offset(enddate, self._width - 1)]
+        )
+
+    def _positions(self, groups: numpy.ndarray, offsets: numpy.ndarray):
+        """positions[g, k]: erster Eintrag der Gruppe groups[g] ab offsets[k]."""
+        keys = groups[:, None] * self._width + offsets[None, :]
+        return numpy.searchsorted(self._keys, keys)
+
+    def total(
+        self,
+        labels: Optional[List[str]] = None,
+        exclude_labels: Optional[List[str]] = None,
+        spender: Optional[str] = None,
+        startdate: Optional[date] = None,
+        enddate: Optional[date] = None,
+    ) -> int:
+        """Summe in Cent aller Einträge, die zu den Filtern passen."""
+        groups = self._groups(labels, exclude_labels, spender)
+        offsets = self._range(startdate, enddate)
+        if offsets[1] <= offsets[0] or not len(groups):
+            return 0
+
+        positions = self._positions(groups, offsets)
+        return int(
+            (self._prefix[positions[:, 1]] - self._prefix[positions[:, 0]]).sum()
+        )
+
+    def binned_totals(
+        self,
+        edges: Sequence[date],
+        labels: Optional[List[str]] = None,
+        exclude_labels: Optional[List[str]] = None,
+        spender: Optional[str] = None,
+    ) -> numpy.ndarray:
+        """Summen in Cent je Intervall [edges[i], edges[i + 1])."""
+        nbins = len(edges) - 1
+        groups = self._groups(labels, exclude_labels, spender)
+        if nbins < 1 or not len(groups):
+            return numpy.zeros(max(nbins, 0), dtype=numpy.int64)
+
+        offsets = numpy.array([self._offset(d, 0) for d in edges])
+        positions = self._positions(groups, offsets)
+        return numpy.diff(self._prefix[positions].sum(axis=0))
+
+    def cumulated(
+        self,
+        labels: Optional[List[str]] = None,
+        exclude_labels: Optional[List[str]] = None,
+        spender: Optional[str] = None,
+        startdate: Optional[date] = None,
+        enddate: Optional[date] = None,
+    ) -> Tuple[numpy.ndarray, numpy.ndarray]:
+        """
+        Daten und laufende Summen in Cent der passenden Einträge, nach Datum
+        sortiert. Bei einer einzigen Gruppe sind das direkt Ausschnitte der
+        Präfixsummen, sonst werden die Abschnitte der Gruppen zusammengeführt.
+        """
+        groups = self._groups(labels, exclude_labels, spender)
+        offsets = self._range(startdate, enddate)
+        if offsets[1] <= offsets[0] or not len(groups):
+            return numpy.zeros(0, dtype="datetime64[D]"), numpy.zeros(
+                0, dtype=numpy.int64
+            )
+
+        positions = self._positions(groups, offsets)
+        if len(groups) == 1:
+            lo, hi = positions[0]
+            days = self._days[lo:hi]
+            sums = self._prefix[lo + 1 : hi + 1] - self._prefix[lo]
+        else:
+            selected = numpy.concatenate(
+                [numpy.arange(lo, hi) for lo, hi in positions if hi > lo]
+                or [numpy.zeros(0, dtype=numpy.int64)]
+            )
+            # nach Datum, bei gleichem Datum in der Reihenfolge der Einträge
+            selected = selected[
+                numpy.lexsort((self._order[selected], self._days[selected]))
+            ]
+            days = self._days[selected]
+            sums = numpy.cumsum(self._values[selected])
+
+        return days.astype("datetime64[D]"), sums
+
+    def label_stats(
+        self,
+        spender: Optional[str] = None,
+        startdate: Optional[date] = None,
+        enddate: Optional[date] = None,
+    ) -> LabelStats:
+        """
+        Kennzahlen der Labels wie RecordStore.label_stats(), je Label aus zwei
+        binär gesuchten Stellen pro Spender statt aus allen Vorkommen.
+        """
+        nlabels = len(self._label_names)
+        spenders = self._spenders(spender)
+        offsets = self._range(startdate, enddate)
+        if offsets[1] <= offsets[0]:
+            spenders = spenders[:0]
+
+        # positions[s, l, k]: erster Eintrag mit Label l von Spender s ab offsets[k]
+        groups = spenders[:, None] * nlabels + numpy.arange(nlabels)[None, :]
+        positions = numpy.searchsorted(
+            self._label_keys, groups[:, :, None] * self._width + offsets
+        )
+        lo, hi = positions[:, :, 0], positions[:, :, 1]
+        counts = (self._occ_prefix[hi] - self._occ_prefix[lo]).sum(axis=0)
+        totals = (self._label_prefix[hi] - self._label_prefix[lo]).sum(axis=0)
+
+        found = hi > lo
+        days = numpy.append(self._label_days, 0)
+        first = numpy.where(found, days[lo], numpy.iinfo(numpy.int64).max).min(
+            axis=0, initial=numpy.iinfo(numpy.int64).max
+        )
+        last = numpy.where(found, days[hi - 1], numpy.iinfo(numpy.int64).min).max(
+            axis=0, initial=numpy.iinfo(numpy.int64).min
+        )
+
+        present = numpy.flatnonzero(counts)
+        return LabelStats(
+            [self._label_names[i] for i in present],
+            counts[present],
+            totals[present],
+            first[present].astype("datetime64[D]"),
+            last[present].astype("datetime64[D]"),
+        )
@@ -0,0 +1,40 @@
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from fimo import importer
+from fimo.cache import file_stat
+
+
+class SourceWatcher:
+    """
+    Erkennt neue, geänderte und gelöschte Kontoauszüge und Regeldateien der
+    Konten, indem Größe und mtime bei jedem poll() verglichen werden.
+
+    Vorschau- und Cache-Dateien werden ignoriert, die schreibt der Import selbst.
+    """
+
+    def __init__(self, accounts: List[importer.Account]):
+        self._accounts = accounts
+        self._snapshot = self._scan()
+
+    def _scan(self) -> Dict[Path, Tuple[int, int]]:
+        snapshot = {}
+        for account in self._accounts:
+            for pattern in ["*.csv", f"{importer.RULES_SUBDIR}/*.csv"]:
+                for filepath in account.srcpath.glob(pattern):
+                    stat = file_stat(filepath)
+                    if stat is not None:
+                        snapshot[filepath] = stat
+
+        return snapshot
+
+    def poll(self) -> List[Path]:
+        """Dateien, die sich seit dem letzten Aufruf geändert haben."""
+        snapshot = self._scan()
+        changed = [
+            filepath
+            for filepath in snapshot.keys() | self._snapshot.keys()
+            if snapshot.get(filepath) != self._snapshot.get(filepath)
+        ]
+        self._snapshot = snapshot
+        return sorted(changed)